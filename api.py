@@ -1,34 +1,412 @@
+import asyncio
+import datetime
+import functools
+import hashlib
+import hmac
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 import uvicorn
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
+from pydantic import BaseModel, Field
 import db_utils # We still use our database logic!
+import exports
+import images
+import itinerary
+import metrics
+import payments
+import pricing
+
+# --- Blocking Work Executor ---
+# db_utils and pricing are synchronous; they run on a bounded pool so the event loop never blocks.
+# Up to MAX_CONCURRENT_EXPORTS export streams and the booking writer hold pooled connections too,
+# so the connection pool is sized for all of them and a worker never waits in acquire().
+DB_WORKERS = 8
+MAX_CONCURRENT_EXPORTS = 2
+db_utils.POOL_SIZE = max(db_utils.POOL_SIZE, DB_WORKERS + MAX_CONCURRENT_EXPORTS + 1)  # + 1: the booking writer
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_WORKERS, thread_name_prefix="tripwala-db")
+
+# Image fetches can be slow (remote hosts), so they get their own pool and never starve DB work
+IMAGE_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tripwala-images")
+THUMBNAIL_MAX_AGE = 7 * 24 * 3600   # Thumbnails are keyed by image_url, so a week is safe
+PLACEHOLDER_MAX_AGE = 300           # Retry soon in case the real image becomes available
+
+async def run_blocking(func, *args, **kwargs):
+    """Runs a blocking db_utils/pricing call on DB_EXECUTOR and awaits its result."""
+    return await asyncio.get_running_loop().run_in_executor(DB_EXECUTOR, functools.partial(func, *args, **kwargs))
+
+# --- Admin Authentication ---
+# Routes that change the catalog or hubs, or export every booking, need "Authorization: Bearer <token>"
+# matching TRIPWALA_ADMIN_TOKEN. Without the variable they are switched off. Only admins can set
+# image_url, so the thumbnail endpoint never fetches a URL an anonymous client chose.
+ADMIN_TOKEN = os.environ.get("TRIPWALA_ADMIN_TOKEN", "")
+
+async def require_admin(authorization: str | None = Header(None)):
+    """Dependency for admin-only routes: 403 if admin routes are off, 401 without the admin token."""
+    if not ADMIN_TOKEN: raise HTTPException(status_code=403, detail="Admin routes are disabled (TRIPWALA_ADMIN_TOKEN is not set)")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Admin token required", headers={"WWW-Authenticate": "Bearer"})
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    DB_EXECUTOR.shutdown(wait=True); IMAGE_EXECUTOR.shutdown(wait=True)
+
+# --- Request Timing ---
+class MetricsMiddleware:
+    """Records every request's latency by route template and status (tripwala_http_request_seconds)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not metrics.ENABLED: return await self.app(scope, receive, send)
+        started = time.perf_counter(); status = 500
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start": status = message["status"]
+            await send(message)
+        try: await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")  # Set by the router; the template keeps label cardinality bounded
+            metrics.observe("tripwala_http_request_seconds", time.perf_counter() - started, method=scope["method"],
+                            route=route.path if route is not None else "unmatched", status=str(status))
 
 # Create the FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+
+# --- Database Initialization ---
+db_utils.initialize_database()
 
 # --- API Endpoints ---
 
+# --- Catalog Snapshot ---
+# The serialized destination list is rebuilt only when the catalog generation in the DB changes
+# (any process's add/update/delete bumps it). The ETag is a hash of the body, so it stays valid across restarts.
+_catalog_snapshot = {"generation": None, "etag": None, "body": b"[]"}
+_catalog_lock = asyncio.Lock()
+
+async def get_catalog_snapshot():
+    global _catalog_snapshot
+    # In-memory on the event loop; once per GENERATION_TTL the SQLite read goes to a worker thread
+    generation = db_utils.peek_generation("catalog")
+    if generation is None: generation = await run_blocking(db_utils.get_generation, "catalog")
+    if _catalog_snapshot["generation"] == generation: return _catalog_snapshot
+    async with _catalog_lock:  # One rebuild per generation, even with many concurrent clients
+        if _catalog_snapshot["generation"] != generation:
+            body = json.dumps(await run_blocking(db_utils.get_all_destinations), separators=(",", ":")).encode()
+            _catalog_snapshot = {"generation": generation, "etag": f'"{hashlib.sha1(body).hexdigest()}"', "body": body}
+    return _catalog_snapshot
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match: return False
+    return if_none_match.strip() == "*" or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+
 @app.get("/")
-def read_root():
+async def read_root():
     """Root endpoint, just to check if the API is running."""
     return {"message": "Welcome to the Trip Wala API!"}
 
+def _metrics_stats():
+    """(gauges, counters) for render_prometheus: pool/writer/cache state now, and their totals since start."""
+    pool = db_utils.get_pool_stats(); writer = db_utils.get_booking_writer_stats(); catalog = db_utils.get_cache_stats()["catalog"]; qr = payments.get_cache_stats()
+    gauges = {
+        "tripwala_db_pool_connections": ("Pooled SQLite connections by state.", [({"state": "in_use"}, pool["in_use"]), ({"state": "idle"}, pool["idle"])]),
+        "tripwala_booking_writer_queued": ("Bookings waiting for the group-commit writer.", writer["queued"]),
+    }
+    counters = {
+        "tripwala_db_pool_waits_total": ("Checkouts that had to wait for a free connection.", pool["waits"]),
+        "tripwala_booking_writer_committed_total": ("Bookings committed by the writer.", writer["committed"]),
+        "tripwala_booking_writer_failed_total": ("Bookings the writer failed to commit.", writer["failed"]),
+        "tripwala_catalog_cache_lookups_total": ("Catalog cache freshness checks by result.", [({"result": "hit"}, catalog["hits"]), ({"result": "miss"}, catalog["misses"])]),
+        "tripwala_qr_cache_lookups_total": ("Rendered-QR cache lookups by result.", [({"result": "hit"}, qr["hits"]), ({"result": "miss"}, qr["misses"])]),
+    }
+    return gauges, counters
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition: function, SQL and request latency histograms plus pool, writer and cache gauges and counters."""
+    gauges, counters = await run_blocking(_metrics_stats)
+    return Response(content=metrics.render_prometheus(gauges, counters), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/metrics/slow-queries")
+async def get_slow_queries():
+    """The most recent statements slower than the slow-query threshold: SQL text and parameter types, never values."""
+    return {"threshold_ms": metrics.SLOW_QUERY_SECONDS * 1000, "enabled": metrics.ENABLED, "queries": metrics.get_slow_queries()}
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters of the shared catalog cache and the current data generations."""
+    return await run_blocking(db_utils.get_cache_stats)
+
+DEFAULT_PAGE_SIZE = 50  # Destinations per page when filtering without an explicit limit
+
 @app.get("/destinations")
-def get_all_destinations():
+async def get_all_destinations(request: Request, response: Response, q: str | None = None, region: str | None = None, min_cost: int | None = Query(None, ge=0),
+                               max_cost: int | None = Query(None, ge=0), limit: int | None = Query(None, ge=1, le=db_utils.MAX_SEARCH_LIMIT), offset: int = Query(0, ge=0)):
     """
     Fetches all destinations from the database.
-    This replaces the load_data() call.
+    This replaces the load_data() call. Send the returned ETag back in
+    If-None-Match to get a 304 when the catalog hasn't changed.
+    With q/region/min_cost/max_cost or limit/offset, returns one page of results
+    instead (one per name, ranked when 'q' is given; 'q' matches word prefixes in
+    name, region and highlights). X-Total-Count carries the number of matches.
+    """
+    if q or region or min_cost is not None or max_cost is not None or limit is not None or offset:
+        page = await run_blocking(db_utils.search_destinations_page, q=q, region=region, min_cost=min_cost, max_cost=max_cost, limit=limit or DEFAULT_PAGE_SIZE, offset=offset)
+        response.headers["X-Total-Count"] = str(page["total"])
+        return page["destinations"]
+    snapshot = await get_catalog_snapshot()
+    headers = {"ETag": snapshot["etag"], "Cache-Control": "no-cache"}
+    if etag_matches(request, snapshot["etag"]): return Response(status_code=304, headers=headers)
+    return Response(content=snapshot["body"], media_type="application/json", headers=headers)
+
+MAX_IMPORT_BYTES = 32 * 1024 * 1024  # Largest bulk import body accepted
+
+async def read_capped_body(request, limit):
+    """The request body, or 413 as soon as it (or its declared Content-Length) exceeds limit bytes."""
+    too_large = HTTPException(status_code=413, detail=f"Request body larger than {limit // (1024 * 1024)} MB")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit: raise too_large
+    chunks = []; size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit: raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+@app.post("/destinations/bulk", dependencies=[Depends(require_admin)])
+async def import_destinations(request: Request, all_or_nothing: bool = False):
     """
-    destinations = db_utils.get_all_destinations()
-    return destinations
+    Upserts destinations by name in one transaction. The body is a JSON list of objects, or CSV
+    (Content-Type: text/csv) with a header row, using the fields name, region, highlights, cost,
+    image_url, latitude and longitude. Invalid rows are reported by index and skipped, or reject
+    the whole batch with all_or_nothing=true. Missing hub distances are estimated afterwards.
+    """
+    # The body is read with a size cap and parsed, imported and cleaned up in worker threads, so a large file never stalls the event loop
+    body = await read_capped_body(request, MAX_IMPORT_BYTES); is_csv = request.headers.get("content-type", "").startswith("text/csv")
+    try: rows = await run_blocking(db_utils.parse_import_file, body, "upload.csv" if is_csv else "upload.json")
+    except ValueError as e: raise HTTPException(status_code=400, detail=f"Could not parse import: {e}")
+    if len(rows) > db_utils.MAX_IMPORT_ROWS: raise HTTPException(status_code=413, detail=f"At most {db_utils.MAX_IMPORT_ROWS:,} rows per import")
+    report = await run_blocking(db_utils.import_destinations, rows, all_or_nothing=all_or_nothing)
+    if report is None: raise HTTPException(status_code=503, detail="Could not import destinations")
+    if report["images_changed"]: await asyncio.get_running_loop().run_in_executor(IMAGE_EXECUTOR, images.invalidate_many, report["images_changed"])
+    if report["ids"]: report["distances_computed"] = await run_blocking(pricing.compute_missing_distances)
+    return report
+
+@app.get("/destinations/{destination_id}/thumbnail")
+async def get_destination_thumbnail(destination_id: int, request: Request, size: str = "card"):
+    """
+    Fixed-size WebP/JPEG thumbnail of a destination's image, served from the
+    local thumbnail cache. Falls back to a placeholder if the image can't be loaded.
+    """
+    if size not in images.THUMBNAIL_SIZES: raise HTTPException(status_code=400, detail=f"size must be one of {', '.join(images.THUMBNAIL_SIZES)}")
+    destination = await run_blocking(db_utils.get_destination, destination_id)
+    if destination is None: raise HTTPException(status_code=404, detail="Destination not found")
+    thumbnail = await asyncio.get_running_loop().run_in_executor(IMAGE_EXECUTOR, images.get_thumbnail, destination_id, destination["image_url"], size)
+    if thumbnail is None:
+        data, media_type = images.placeholder_thumbnail(size)
+        return Response(content=data, media_type=media_type, headers={"Cache-Control": f"public, max-age={PLACEHOLDER_MAX_AGE}"})
+    data, media_type, key = thumbnail
+    headers = {"ETag": f'"{key}"', "Cache-Control": f"public, max-age={THUMBNAIL_MAX_AGE}"}
+    if etag_matches(request, headers["ETag"]): return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=media_type, headers=headers)
 
 @app.get("/bookings/{username}")
-def get_user_bookings(username: str):
+async def get_user_bookings(username: str, limit: int = Query(20, ge=1, le=db_utils.MAX_BOOKINGS_PAGE_SIZE), before: str | None = None):
+    """
+    Fetches one page of bookings for a specific user, newest first.
+    'username' is passed from the URL. Pass the returned 'next_cursor'
+    back as 'before' to get the next page.
+    """
+    try: return await run_blocking(db_utils.get_user_bookings_page, username, limit=limit, before=before)
+    except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+
+# --- Creating Bookings ---
+MAX_BOOKINGS_PER_BATCH = 500
+
+class BookingIn(BaseModel):
+    username: str = Field(min_length=1)
+    start_city: str
+    destination_name: str
+    num_people: int = Field(ge=1)
+    stay_days: int = Field(ge=1)
+    transport_mode: str
+    total_budget: float = Field(ge=0)
+
+async def save_booking_async(booking):
+    """Queues a booking on the group-commit writer and awaits its commit without holding an executor thread."""
+    await asyncio.wrap_future(db_utils.submit_booking(booking.username, booking.model_dump(exclude={"username"})))
+
+@app.post("/bookings", status_code=201)
+async def create_booking(booking: BookingIn):
+    """Saves one booking. Concurrent requests are committed together in a single transaction."""
+    try: await save_booking_async(booking)
+    except ValueError as e: raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e: raise HTTPException(status_code=503, detail=f"Could not save booking: {e}")
+    return {"success": True}
+
+@app.post("/bookings/batch")
+async def create_bookings(bookings: list[BookingIn]):
+    """Saves many bookings. Returns a success flag (and error, if any) for every booking, in request order."""
+    if len(bookings) > MAX_BOOKINGS_PER_BATCH: raise HTTPException(status_code=413, detail=f"At most {MAX_BOOKINGS_PER_BATCH} bookings per batch")
+    outcomes = await asyncio.gather(*[save_booking_async(booking) for booking in bookings], return_exceptions=True)
+    results = [{"index": i, "success": outcome is None, "error": None if outcome is None else (str(outcome) or type(outcome).__name__)} for i, outcome in enumerate(outcomes)]
+    return {"saved": sum(r["success"] for r in results), "failed": sum(not r["success"] for r in results), "results": results}
+
+# --- Payment QR Codes ---
+QR_MAX_AGE = 24 * 3600  # The image depends only on the query string
+
+class PendingPaymentIn(BaseModel):
+    total_budget: float = Field(gt=0)
+    destination_name: str = Field(min_length=1)
+
+@app.get("/payments/qr")
+async def get_payment_qr(request: Request, amount: float = Query(gt=0), dest: str = Query(min_length=1), format: str = "png"):
+    """UPI payment QR code (PNG or SVG) for a trip, served from an in-memory LRU of rendered codes."""
+    if format not in payments.QR_FORMATS: raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(payments.QR_FORMATS)}")
+    data, media_type = await run_blocking(payments.payment_qr, amount, dest, format)
+    headers = {"ETag": f'"{hashlib.sha1(data).hexdigest()}"', "Cache-Control": f"public, max-age={QR_MAX_AGE}"}
+    if etag_matches(request, headers["ETag"]): return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=media_type, headers=headers)
+
+@app.post("/payments/qr/prerender")
+async def prerender_payment_qrs(pending: list[PendingPaymentIn], format: str = "png"):
+    """Renders QR codes for a batch of pending bookings ahead of time so later GETs are cache hits."""
+    if format not in payments.QR_FORMATS: raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(payments.QR_FORMATS)}")
+    payloads = await run_blocking(payments.prerender_qr_codes, [p.model_dump() for p in pending], format)
+    return {"rendered": len(payloads), "cache": payments.get_cache_stats()}
+
+@app.get("/quotes")
+async def get_quotes(hub: list[str] | None = Query(None), mode: list[str] | None = Query(None), num_people: list[int] = Query([1]), stay_days: list[int] = Query([2])):
     """
-    Fetches all bookings for a specific user.
-    'username' is passed from the URL.
+    Batch-prices every destination for each combination of hub, transport mode,
+    party size and stay length. Repeat a parameter to add values, e.g.
+    /quotes?hub=Sangli&hub=Ashta&num_people=2&num_people=4.
+    'totals' is indexed [destination][hub][mode][num_people][stay_days].
     """
-    bookings = db_utils.get_user_bookings(username)
-    return bookings
+    if any(n < 1 for n in num_people) or any(d < 1 for d in stay_days): raise HTTPException(status_code=400, detail="num_people and stay_days must be >= 1")
+    try: return await run_blocking(pricing.get_quote_matrix, hubs=hub, modes=mode, num_people=num_people, stay_days=stay_days)
+    except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+
+# --- Hubs, Coordinates and Distance Ranking ---
+class HubIn(BaseModel):
+    name: str = Field(min_length=1)
+    latitude: float | None = Field(None, ge=-90, le=90)
+    longitude: float | None = Field(None, ge=-180, le=180)
+
+class CoordinatesIn(BaseModel):
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+
+@app.get("/hubs")
+async def get_hubs():
+    """Lists the start hubs trips can be priced from."""
+    return await run_blocking(db_utils.get_all_hubs)
+
+@app.post("/hubs", status_code=201, dependencies=[Depends(require_admin)])
+async def add_hub(hub: HubIn):
+    """Registers a new start hub. Distances to destinations with coordinates are estimated right away."""
+    if not await run_blocking(db_utils.add_hub, hub.name, hub.latitude, hub.longitude): raise HTTPException(status_code=409, detail=f"Could not add hub '{hub.name}' (already exists?)")
+    return {"name": hub.name, "distances_computed": await run_blocking(pricing.compute_missing_distances)}
+
+@app.put("/destinations/{destination_id}/coordinates", dependencies=[Depends(require_admin)])
+async def set_destination_coordinates(destination_id: int, coordinates: CoordinatesIn):
+    """Sets a destination's coordinates and estimates any missing hub distances for it."""
+    if not await run_blocking(db_utils.set_destination_coordinates, destination_id, coordinates.latitude, coordinates.longitude): raise HTTPException(status_code=404, detail="Destination not found")
+    return {"id": destination_id, "distances_computed": await run_blocking(pricing.compute_missing_distances)}
+
+@app.post("/distances/compute", dependencies=[Depends(require_admin)])
+async def compute_missing_distances():
+    """Estimates every missing hub -> destination distance from coordinates in one bulk pass."""
+    return {"distances_computed": await run_blocking(pricing.compute_missing_distances)}
+
+@app.get("/destinations/ranked")
+async def get_ranked_destinations(hub: str, k: int = Query(5, ge=1, le=100), budget: float | None = Query(None, gt=0), by: str = "total",
+                                  num_people: int = Query(1, ge=1), stay_days: int = Query(2, ge=1), mode: str = "Car"):
+    """
+    Top-k destinations from a hub: cheapest total trip cost (by=total) or
+    nearest (by=distance), optionally only those within 'budget' rupees.
+    """
+    if mode not in pricing.TRANSPORT_RATES_PER_KM: raise HTTPException(status_code=400, detail=f"Unknown transport mode: {mode}")
+    try: return await run_blocking(pricing.rank_destinations, hub, k=k, budget=budget, by=by, num_people=num_people, stay_days=stay_days, transport_mode=mode)
+    except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+
+# --- Multi-Stop Itineraries ---
+class ItineraryIn(BaseModel):
+    hub: str = Field(min_length=1)
+    destination_ids: list[int] = Field(min_length=1, max_length=itinerary.MAX_STOPS)
+    days: int | list[int] = 2
+    num_people: int = Field(1, ge=1)
+    transport_mode: str = "Car"
+    time_budget_ms: int = Field(itinerary.HEURISTIC_TIME_BUDGET_MS, ge=1, le=2000)
+
+@app.post("/itineraries")
+async def plan_itinerary(request: ItineraryIn):
+    """
+    Cheapest circuit from a hub through every destination and back, with a per-stop cost
+    breakdown. days is the stay at each stop (one value, or one per destination).
+    Exact up to itinerary.EXACT_MAX_STOPS stops, best-effort within time_budget_ms above that.
+    """
+    try: return await run_blocking(itinerary.plan_itinerary, request.hub, request.destination_ids, days=request.days, num_people=request.num_people,
+                                   transport_mode=request.transport_mode, time_budget_ms=request.time_budget_ms)
+    except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+
+# --- Booking Analytics ---
+# Served from the rollup tables, so cost depends on the date range (or, all-time, the key count), not on booking volume
+@app.get("/analytics/daily")
+async def get_daily_analytics(dimension: str | None = None, start: datetime.date | None = None, end: datetime.date | None = None):
+    """Bookings, travellers and revenue per UTC day; broken down by destination, start_city or transport_mode when dimension is given."""
+    if dimension is None: return await run_blocking(db_utils.get_daily_totals, start, end)
+    try: return await run_blocking(db_utils.get_daily_rollup, dimension, start, end)
+    except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/analytics/top")
+async def get_top_analytics(dimension: str = "destination", start: datetime.date | None = None, end: datetime.date | None = None,
+                            limit: int = Query(10, ge=1, le=db_utils.MAX_ANALYTICS_LIMIT)):
+    """Destinations, start cities or transport modes ranked by revenue over the date range."""
+    try: return await run_blocking(db_utils.get_top_by, dimension, start, end, limit)
+    except ValueError as e: raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/analytics/routes")
+async def get_top_routes(limit: int = Query(10, ge=1, le=db_utils.MAX_ANALYTICS_LIMIT)):
+    """Most booked start_city -> destination routes of all time."""
+    return await run_blocking(db_utils.get_top_routes, limit)
+
+# --- Streaming Exports ---
+# Rows are read with fetchmany() and written out chunk by chunk (Parquet: one row group at a time),
+# so memory stays bounded whatever the table size. Each running export holds one pooled connection,
+# hence the cap on concurrent exports (MAX_CONCURRENT_EXPORTS, counted in the pool size above).
+_export_slots = asyncio.Semaphore(MAX_CONCURRENT_EXPORTS)
+
+async def stream_export(dataset, fmt, **filters):
+    if fmt not in exports.FORMATS: raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(exports.FORMATS)}")
+    if _export_slots.locked(): raise HTTPException(status_code=503, detail="Too many exports running, try again shortly", headers={"Retry-After": "10"})
+    await _export_slots.acquire()
+    try: stream, media_type, file_name = exports.stream_export(dataset, fmt, **filters)
+    except ValueError as e: _export_slots.release(); raise HTTPException(status_code=400, detail=str(e))
+    async def body():
+        try:
+            async for block in iterate_in_threadpool(stream): yield block
+        finally: stream.close(); _export_slots.release()
+    return StreamingResponse(body(), media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{file_name}"'})
+
+@app.get("/export/bookings.{fmt}", dependencies=[Depends(require_admin)])
+async def export_bookings(fmt: str, username: str | None = None, start: datetime.date | None = None, end: datetime.date | None = None):
+    """All bookings (optionally one user's, or booked between start and end, inclusive, UTC) as streamed CSV or Parquet."""
+    return await stream_export("bookings", fmt, username=username, start=start, end=end)
+
+@app.get("/export/destinations.{fmt}")
+async def export_destinations(fmt: str):
+    """The destination catalog as streamed CSV or Parquet."""
+    return await stream_export("destinations", fmt)
 
 # This line allows you to run the API directly with `python api.py`
 if __name__ == "__main__":
@@ -0,0 +1,412 @@
+"""
+Trip Wala performance benchmarks.
+
+Seeds a synthetic SQLite database, times the hot paths (db_utils, pricing, payments and the
+api.py routes through an in-process ASGI client) and writes the results as JSON with
+percentiles. Runs fully offline; nothing touches the network or the real tripwala.db.
+
+    python benchmark.py --quick                          # small data set, a few seconds
+    python benchmark.py                                  # 10k destinations, 5M bookings, 100k users
+    python benchmark.py --save-baseline                  # store this run as the baseline
+    python benchmark.py --baseline benchmark_baseline.json --fail-on-regression
+
+Baselines are machine specific: save one on the box you compare on.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import db_utils
+import images
+import itinerary
+import metrics
+import payments
+import pricing
+
+# --- Settings ---
+DEFAULT_DB = "benchmark.db"
+DEFAULT_OUT = "benchmark_results.json"
+DEFAULT_BASELINE = "benchmark_baseline.json"
+FULL_SIZES = {"destinations": 10_000, "bookings": 5_000_000, "users": 100_000}
+QUICK_SIZES = {"destinations": 1_000, "bookings": 50_000, "users": 1_000}
+REGRESSION_THRESHOLD = 1.25   # Flag a benchmark when its p50 is this many times the baseline's (p95 is reported, but too noisy to gate on)
+MIN_REGRESSION_MS = 0.1       # Ignore slowdowns smaller than this; sub-0.1 ms timings jitter by more than the threshold
+SEED_CHUNK = 100_000          # Rows per executemany while seeding
+BOOKING_DAYS = 365            # Synthetic bookings are spread over the past year
+PERCENTILES = (50, 90, 95, 99)
+
+REGIONS = ["Maharashtra", "Goa", "Karnataka", "Gujarat", "Kerala", "Rajasthan", "Madhya Pradesh", "Himachal Pradesh"]
+HIGHLIGHT_WORDS = ["Beaches", "Forts", "Temples", "Waterfalls", "Trekking", "Wildlife", "Caves", "Lakes", "Cuisine", "Vineyards", "Viewpoints", "Markets"]
+
+# --- Synthetic Data ---
+def seed_database(path, sizes, seed=42):
+    """Creates a fresh database at path with the requested numbers of destinations, users and bookings."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix): os.remove(path + suffix)
+    db_utils.DB_FILE = path
+    db_utils.initialize_database()  # Schema, migrations and the sample catalog
+    rng = random.Random(seed); timings = {}
+
+    started = time.perf_counter()
+    destinations = [(f"Destination {i:05d}", rng.choice(REGIONS), ", ".join(rng.sample(HIGHLIGHT_WORDS, 3)), rng.randrange(200, 2000, 10), None,
+                     round(rng.uniform(15.6, 21.9), 4), round(rng.uniform(72.7, 80.8), 4)) for i in range(sizes["destinations"])]
+    _bulk_insert("INSERT INTO destinations (name, region, highlights, cost, image_url, latitude, longitude) VALUES (?, ?, ?, ?, ?, ?, ?)", destinations)
+    timings["destinations"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    pricing.compute_missing_distances()  # Estimated hub distances for every synthetic destination
+    timings["distances"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    import bcrypt
+    password_hash = bcrypt.hashpw(b"benchmark", bcrypt.gensalt(rounds=4)).decode()  # One shared hash; bcrypt per user would take hours
+    _bulk_insert(db_utils.INSERT_USER_SQL, ((f"user{i:06d}", f"user{i:06d}@example.com", "Bench", f"User {i}", f"Bench User {i}", password_hash, None, None)
+                                             for i in range(sizes["users"])))
+    timings["users"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    hubs = list(db_utils.SEED_HUB_COORDINATES); names = [d[0] for d in destinations] or [name for name, *_ in db_utils.SAMPLE_DESTINATIONS]
+    modes = list(pricing.TRANSPORT_RATES_PER_KM); now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+    def bookings():
+        for _ in range(sizes["bookings"]):
+            people = rng.randint(1, 6)
+            when = now - datetime.timedelta(seconds=rng.randrange(BOOKING_DAYS * 86400))
+            yield (f"user{rng.randrange(max(1, sizes['users'])):06d}", rng.choice(hubs), rng.choice(names), people, rng.randint(1, 7),
+                   rng.choice(modes), float(rng.randrange(1000, 50000)), when.strftime("%Y-%m-%d %H:%M:%S"))
+    _bulk_insert("INSERT INTO bookings (username, start_city, destination_name, num_people, stay_days, transport_mode, total_budget, booking_timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", bookings())
+    timings["bookings"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    db_utils.rebuild_rollups()
+    timings["rollups"] = time.perf_counter() - started
+    conn = db_utils.get_db_connection()
+    try: conn.execute("ANALYZE"); conn.commit()
+    finally: conn.close()
+    return timings
+
+def _bulk_insert(sql, rows):
+    """Inserts rows in chunks inside one transaction (the seeding equivalent of the booking writer's batches)."""
+    conn = db_utils.get_db_connection(); rows = iter(rows)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        while True:
+            chunk = [row for _, row in zip(range(SEED_CHUNK), rows)]
+            if not chunk: break
+            conn.executemany(sql, chunk)
+        conn.commit()
+    except Exception: conn.rollback(); raise
+    finally: conn.close()
+
+# --- In-Process ASGI Client ---
+class ASGIClient:
+    """
+    Calls an ASGI app directly on a private event loop -- no sockets, no server, no httpx.
+    Good enough for timing routes; it does not run the app's lifespan.
+    """
+
+    def __init__(self, app):
+        self.app = app; self.loop = asyncio.new_event_loop()
+
+    def request(self, method, url, json_body=None, headers=None):
+        """Returns (status, headers dict, body bytes)."""
+        return self.loop.run_until_complete(self._request(method, url, json_body, headers or {}))
+
+    async def _request(self, method, url, json_body, headers):
+        path, _, query = url.partition("?")
+        body = json.dumps(json_body).encode() if json_body is not None else b""
+        raw_headers = [(b"host", b"benchmark")] + [(k.lower().encode(), str(v).encode()) for k, v in headers.items()]
+        if json_body is not None: raw_headers += [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+                 "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+                 "headers": raw_headers, "client": ("127.0.0.1", 0), "server": ("benchmark", 80)}
+        response = {"status": None, "headers": {}, "body": []}; finished = asyncio.Event(); body_sent = False
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent: body_sent = True; return {"type": "http.request", "body": body, "more_body": False}
+            await finished.wait()  # Only report a disconnect once the response is complete
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]; response["headers"] = {k.decode(): v.decode() for k, v in message.get("headers", [])}
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+                if not message.get("more_body"): finished.set()
+
+        await self.app(scope, receive, send)
+        return response["status"], response["headers"], b"".join(response["body"])
+
+    def close(self):
+        self.loop.close()
+
+# --- Timing ---
+def summarize(samples, wall=None):
+    """Latency stats in milliseconds (nearest-rank percentiles), plus throughput when the wall time is given."""
+    ordered = sorted(samples); n = len(ordered)
+    stats = {"count": n, "mean_ms": sum(ordered) / n * 1000, "min_ms": ordered[0] * 1000, "max_ms": ordered[-1] * 1000}
+    for p in PERCENTILES: stats[f"p{p}_ms"] = ordered[max(0, math.ceil(p / 100 * n) - 1)] * 1000
+    if wall: stats["ops_per_sec"] = n / wall
+    return {k: round(v, 4) if isinstance(v, float) else v for k, v in stats.items()}
+
+def time_calls(fn, args_list, warmup=3):
+    """Times fn(*args) for each args tuple; the first few calls warm caches and are not recorded."""
+    for args in args_list[:warmup]: fn(*args)
+    samples = []
+    for args in args_list:
+        started = time.perf_counter(); fn(*args); samples.append(time.perf_counter() - started)
+    return samples
+
+def time_concurrent(fn, args_list, threads):
+    """Runs fn(*args) across a thread pool; returns (per-call latencies, wall time)."""
+    def timed(args):
+        started = time.perf_counter(); fn(*args); return time.perf_counter() - started
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor: samples = list(executor.map(timed, args_list))
+    return samples, time.perf_counter() - started
+
+# --- Benchmarks ---
+# Each takes the run context and returns (samples, wall time or None)
+BENCHMARKS = {}
+
+def benchmark(name):
+    def register(fn): BENCHMARKS[name] = fn; return fn
+    return register
+
+def _cold_catalog():
+    db_utils._catalog_cache.clear(); db_utils.get_all_destinations()
+
+@benchmark("db.get_all_destinations.cold")
+def _(ctx): return time_calls(_cold_catalog, [()] * max(5, ctx.iterations // 20), warmup=1), None
+
+@benchmark("db.get_all_destinations.warm")
+def _(ctx): return time_calls(db_utils.get_all_destinations, [()] * ctx.iterations), None
+
+@benchmark("db.get_destination")
+def _(ctx): return time_calls(db_utils.get_destination, [(ctx.rng.choice(ctx.destination_ids),) for _ in range(ctx.iterations * 10)]), None
+
+@benchmark("db.search_destinations")
+def _(ctx):
+    queries = [(ctx.rng.choice(HIGHLIGHT_WORDS)[:ctx.rng.randint(2, 5)], ctx.rng.choice(REGIONS + ["All"])) for _ in range(ctx.iterations)]
+    return time_calls(lambda q, region: db_utils.search_destinations(q=q, region=region), queries), None
+
+@benchmark("db.search_destinations_page")
+def _(ctx):
+    pages = max(1, min(ctx.sizes["destinations"], 2000) // 12)
+    return time_calls(lambda offset: db_utils.search_destinations_page(limit=12, offset=offset), [(ctx.rng.randrange(pages) * 12,) for _ in range(ctx.iterations)]), None
+
+@benchmark("db.get_user_bookings")
+def _(ctx): return time_calls(db_utils.get_user_bookings, [(ctx.random_user(),) for _ in range(ctx.iterations)]), None
+
+@benchmark("db.get_user_bookings_page")
+def _(ctx): return time_calls(db_utils.get_user_bookings_page, [(ctx.random_user(),) for _ in range(ctx.iterations)]), None
+
+@benchmark("db.save_booking.concurrent")
+def _(ctx):
+    trips = [(ctx.random_user(), ctx.trip()) for _ in range(ctx.iterations * 5)]
+    return time_concurrent(db_utils.save_booking, trips, ctx.threads)
+
+@benchmark("db.get_credentials.cold")
+def _(ctx):
+    def cold(): db_utils._credentials_cache["generation"] = None; db_utils.get_credentials()
+    return time_calls(cold, [()] * max(5, ctx.iterations // 20), warmup=1), None
+
+@benchmark("db.import_destinations.updates")
+def _(ctx):
+    rows = [{field: d[field] for field in db_utils.IMPORT_FIELDS} for d in db_utils.get_all_destinations()[:5000]]
+    def upsert(bump):
+        for row in rows: row["cost"] += bump  # Every row changes, so each call writes the full batch
+        return db_utils.import_destinations(rows)
+    return time_calls(upsert, [(1 if i % 2 == 0 else -1,) for i in range(6)], warmup=0), None
+
+@benchmark("db.analytics.top_destinations")
+def _(ctx): return time_calls(db_utils.get_top_by, [("destination",)] * ctx.iterations), None
+
+@benchmark("pricing.quote_trip")
+def _(ctx):
+    matrix = pricing.get_distance_matrix(); hub = matrix.hub_names[0]
+    def quote(destination_id):
+        destination = db_utils.get_destination(destination_id)  # What the planner does per rerun
+        return pricing.quote_trip(hub, destination["name"], destination["cost"], matrix.distance(hub, destination_id) or 0, 2, 3, "Car")
+    return time_calls(quote, [(ctx.rng.choice(ctx.destination_ids),) for _ in range(ctx.iterations * 10)]), None
+
+@benchmark("pricing.rank_destinations")
+def _(ctx):
+    hubs = pricing.get_distance_matrix().hub_names
+    return time_calls(lambda hub: pricing.rank_destinations(hub, k=10, budget=20000, num_people=2, stay_days=3), [(ctx.rng.choice(hubs),) for _ in range(ctx.iterations)]), None
+
+@benchmark("pricing.get_quote_matrix")
+def _(ctx): return time_calls(lambda: pricing.get_quote_matrix(num_people=(1, 2, 4), stay_days=(2, 3)), [()] * max(5, ctx.iterations // 10)), None
+
+@benchmark("itinerary.plan_itinerary.exact")
+def _(ctx):
+    hubs = pricing.get_distance_matrix().hub_names
+    return time_calls(lambda hub, stops: itinerary.plan_itinerary(hub, stops, days=2, num_people=2), [(ctx.rng.choice(hubs), ctx.rng.sample(ctx.destination_ids, 10)) for _ in range(ctx.iterations)]), None
+
+@benchmark("itinerary.plan_itinerary.heuristic")
+def _(ctx):
+    hubs = pricing.get_distance_matrix().hub_names
+    return time_calls(lambda hub, stops: itinerary.plan_itinerary(hub, stops, days=1), [(ctx.rng.choice(hubs), ctx.rng.sample(ctx.destination_ids, 40)) for _ in range(max(5, ctx.iterations // 10))]), None
+
+@benchmark("payments.generate_qr_code.cold")
+def _(ctx):
+    def cold(amount): payments._render_qr.cache_clear(); payments.generate_qr_code(payments.upi_payload(amount, "Benchmark"))
+    return time_calls(cold, [(ctx.rng.randrange(1000, 50000),) for _ in range(max(10, ctx.iterations // 4))]), None
+
+@benchmark("payments.generate_qr_code.warm")
+def _(ctx): return time_calls(payments.generate_qr_code, [(payments.upi_payload(12345, "Benchmark"),)] * ctx.iterations), None
+
+def _route(ctx, method, url_fn, json_fn=None, headers_fn=None, expect=(200,)):
+    def call(i):
+        status, _, body = ctx.client.request(method, url_fn(i), json_fn(i) if json_fn else None, headers_fn(i) if headers_fn else None)
+        if status not in expect: raise RuntimeError(f"{method} {url_fn(i)} -> {status}: {body[:200]!r}")
+    return time_calls(call, [(i,) for i in range(ctx.iterations)]), None
+
+@benchmark("api.GET /destinations")
+def _(ctx): return _route(ctx, "GET", lambda i: "/destinations")
+
+@benchmark("api.GET /destinations (304)")
+def _(ctx):
+    _, headers, _ = ctx.client.request("GET", "/destinations")
+    return _route(ctx, "GET", lambda i: "/destinations", headers_fn=lambda i: {"If-None-Match": headers["etag"]}, expect=(304,))
+
+@benchmark("api.GET /destinations?q=")
+def _(ctx): return _route(ctx, "GET", lambda i: f"/destinations?q={ctx.rng.choice(HIGHLIGHT_WORDS)[:4]}&limit=50")
+
+@benchmark("api.GET /bookings/{username}")
+def _(ctx): return _route(ctx, "GET", lambda i: f"/bookings/{ctx.random_user()}")
+
+@benchmark("api.POST /bookings")
+def _(ctx): return _route(ctx, "POST", lambda i: "/bookings", json_fn=lambda i: dict(ctx.trip(), username=ctx.random_user()), expect=(201,))
+
+@benchmark("api.GET /destinations/ranked")
+def _(ctx):
+    hubs = pricing.get_distance_matrix().hub_names
+    return _route(ctx, "GET", lambda i: f"/destinations/ranked?hub={ctx.rng.choice(hubs)}&k=10&num_people=2&stay_days=3")
+
+@benchmark("api.POST /itineraries")
+def _(ctx):
+    hubs = pricing.get_distance_matrix().hub_names
+    return _route(ctx, "POST", lambda i: "/itineraries", json_fn=lambda i: {"hub": ctx.rng.choice(hubs), "destination_ids": ctx.rng.sample(ctx.destination_ids, 6), "days": 2})
+
+@benchmark("api.GET /payments/qr")
+def _(ctx): return _route(ctx, "GET", lambda i: f"/payments/qr?amount={ctx.rng.randrange(1000, 5000)}&dest=Benchmark")
+
+@benchmark("api.GET /analytics/daily")
+def _(ctx): return _route(ctx, "GET", lambda i: "/analytics/daily?dimension=transport_mode")
+
+class Context:
+    """What the benchmarks share: the seeded ids, a seeded RNG and the ASGI client."""
+
+    def __init__(self, iterations, threads, seed, sizes):
+        self.iterations = iterations; self.threads = threads; self.rng = random.Random(seed + 1); self.sizes = sizes
+        conn = db_utils.get_db_connection()
+        try: self.destination_ids = [row[0] for row in conn.execute("SELECT id FROM destinations")]
+        finally: conn.close()
+        self.hubs = list(db_utils.SEED_HUB_COORDINATES)
+        import api  # Imported after DB_FILE points at the benchmark database (api initializes it at import)
+        self.client = ASGIClient(api.app)
+
+    def random_user(self):
+        return f"user{self.rng.randrange(max(1, self.sizes['users'])):06d}"
+
+    def trip(self):
+        destination = db_utils.get_destination(self.rng.choice(self.destination_ids))
+        return {"start_city": self.rng.choice(self.hubs), "destination_name": destination["name"], "num_people": 2, "stay_days": 3,
+                "transport_mode": "Car", "total_budget": float(destination["cost"] * 6)}
+
+# --- Baseline Comparison ---
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Per-benchmark p50/p95 ratios against the baseline. Returns (rows, names whose p50 regressed)."""
+    rows, regressions = [], []
+    for name, stats in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None: rows.append((name, None, None, "new")); continue
+        ratios = {p: stats[p] / base[p] if base[p] > 0 else None for p in ("p50_ms", "p95_ms")}
+        regressed = ratios["p50_ms"] is not None and ratios["p50_ms"] > threshold and stats["p50_ms"] - base["p50_ms"] > MIN_REGRESSION_MS
+        if regressed: regressions.append(name)
+        rows.append((name, ratios["p50_ms"], ratios["p95_ms"], "REGRESSED" if regressed else "ok"))
+    return rows, regressions
+
+def _git_commit():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError): return None
+
+# --- Command Line ---
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trip Wala performance benchmarks")
+    parser.add_argument("--db", default=DEFAULT_DB, help="Benchmark database file (recreated unless --reuse)")
+    parser.add_argument("--reuse", action="store_true", help="Reuse an already seeded --db instead of seeding a new one")
+    parser.add_argument("--quick", action="store_true", help=f"Small data set: {QUICK_SIZES}")
+    for key in FULL_SIZES: parser.add_argument(f"--{key}", type=int, help=f"Number of synthetic {key} (default {FULL_SIZES[key]:,})")
+    parser.add_argument("--iterations", type=int, default=200, help="Timed calls per benchmark (some scale this down or up)")
+    parser.add_argument("--threads", type=int, default=16, help="Concurrent writers for save_booking")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", action="append", help="Run only benchmarks whose name contains this text (repeatable)")
+    parser.add_argument("--out", default=DEFAULT_OUT, help="Where to write the JSON results")
+    parser.add_argument("--baseline", help=f"Compare against this results file (default {DEFAULT_BASELINE} if it exists)")
+    parser.add_argument("--save-baseline", action="store_true", help="Also write the results to the baseline file")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="Slowdown ratio that counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 when a regression is flagged")
+    args = parser.parse_args(argv)
+
+    sizes = dict(QUICK_SIZES if args.quick else FULL_SIZES)
+    for key in sizes:
+        if getattr(args, key) is not None: sizes[key] = getattr(args, key)
+    images.OFFLINE = True  # Never fetch anything
+    db_utils.DB_FILE = args.db
+
+    seed_timings = None
+    if not args.reuse or not os.path.exists(args.db):
+        print(f"Seeding {args.db}: {sizes['destinations']:,} destinations, {sizes['bookings']:,} bookings, {sizes['users']:,} users...")
+        seed_timings = {k: round(v, 3) for k, v in seed_database(args.db, sizes, args.seed).items()}
+        print(f"Seeded in {sum(seed_timings.values()):.1f}s {seed_timings}")
+    db_utils.initialize_database()
+
+    ctx = Context(args.iterations, args.threads, args.seed, sizes)
+    results = {}
+    try:
+        for name, run in BENCHMARKS.items():
+            if args.only and not any(text in name for text in args.only): continue
+            samples, wall = run(ctx)
+            results[name] = summarize(samples, wall)
+            print(f"{name:<40} p50 {results[name]['p50_ms']:>10.3f} ms   p95 {results[name]['p95_ms']:>10.3f} ms   n={results[name]['count']}")
+    finally: ctx.client.close()
+
+    report = {"meta": {"created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"), "git_commit": _git_commit(),
+                       "python": sys.version.split()[0], "platform": platform.platform(), "cpu_count": os.cpu_count(),
+                       "sizes": sizes, "metrics_enabled": metrics.ENABLED, "iterations": args.iterations, "threads": args.threads, "seed": args.seed, "seed_seconds": seed_timings},
+              "results": results}
+
+    baseline_path = args.baseline or (DEFAULT_BASELINE if os.path.exists(DEFAULT_BASELINE) else None)
+    regressions = []
+    if baseline_path and os.path.exists(baseline_path):
+        with open(baseline_path) as file: baseline = json.load(file)
+        if baseline.get("meta", {}).get("sizes") != sizes: print(f"Note: baseline was recorded with sizes {baseline.get('meta', {}).get('sizes')}")
+        rows, regressions = compare(results, baseline, args.threshold)
+        print(f"\nCompared with {baseline_path} (threshold {args.threshold}x):")
+        for name, p50, p95, verdict in rows:
+            print(f"{name:<40} p50 {'-' if p50 is None else f'{p50:.2f}x':>7}   p95 {'-' if p95 is None else f'{p95:.2f}x':>7}   {verdict}")
+        report["comparison"] = {"baseline": baseline_path, "threshold": args.threshold, "regressions": regressions}
+
+    with open(args.out, "w") as file: json.dump(report, file, indent=2)
+    print(f"\nWrote {args.out}")
+    if args.save_baseline:
+        with open(args.baseline or DEFAULT_BASELINE, "w") as file: json.dump(report, file, indent=2)
+        print(f"Saved baseline to {args.baseline or DEFAULT_BASELINE}")
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        if args.fail_on_regression: return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
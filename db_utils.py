@@ -1,14 +1,163 @@
 import sqlite3
 import datetime # Needed for timestamp
+import base64
+import json
+import os
+import re
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import metrics
 
 # Define the database file
 DB_FILE = "tripwala.db"
 
+# --- Connection Pool Settings ---
+POOL_SIZE = 8               # Max open connections per process
+POOL_TIMEOUT = 10.0         # Seconds to wait for a free connection
+BUSY_TIMEOUT_MS = 5000      # How long SQLite waits on a locked database
+STATEMENT_CACHE_SIZE = 256  # Prepared statements kept per connection
+PRAGMAS = {
+    "journal_mode": "WAL",      # Readers don't block the writer
+    "synchronous": "NORMAL",    # Safe with WAL, far fewer fsyncs
+    "busy_timeout": BUSY_TIMEOUT_MS,
+    "cache_size": -16000,       # ~16 MB page cache (negative = KiB)
+    "mmap_size": 134217728,     # 128 MB memory-mapped reads
+    "temp_store": "MEMORY",
+}
+
+# --- Connection Pool ---
+_FREE_SLOT = object()  # Queued in place of a dropped connection so a waiting acquire() wakes up and opens a new one
+
+class ConnectionPool:
+    """Thread-safe pool of persistent SQLite connections for one database file."""
+
+    def __init__(self, db_file, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.db_file = db_file; self.size = size; self.timeout = timeout
+        self._idle = queue.LifoQueue()  # LIFO keeps the warmest connections busy
+        self._lock = threading.Lock()
+        self._open = 0; self._checkouts = 0; self._waits = 0; self._created = 0
+        self._free_slots = 0  # _FREE_SLOT markers queued in _idle: slots counted in _open whose connection was dropped
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        for pragma, value in PRAGMAS.items(): conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def acquire(self):
+        """Checks out a connection, opening a new one or waiting if the pool is exhausted."""
+        with self._lock:
+            self._checkouts += 1
+            try: conn = self._idle.get_nowait(); wait = False
+            except queue.Empty:
+                conn = None; wait = self._open >= self.size
+                if wait: self._waits += 1
+                else: self._open += 1  # A new slot
+        if wait:
+            try: conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty: raise sqlite3.OperationalError(f"No free database connection after {self.timeout}s")
+        if conn is _FREE_SLOT:
+            with self._lock: self._free_slots -= 1
+            conn = None
+        if conn is not None: return conn
+        try: conn = self._connect()
+        except sqlite3.Error: self._free_slot(); raise
+        with self._lock: self._created += 1
+        return conn
+
+    def _free_slot(self):
+        """Queues an empty slot, waking a waiting acquire() to open a fresh connection in it. The slot stays counted in _open."""
+        with self._lock: self._free_slots += 1
+        self._idle.put(_FREE_SLOT)
+
+    def release(self, conn):
+        """Returns a connection to the pool, rolling back anything left uncommitted."""
+        try:
+            if conn.in_transaction: conn.rollback()
+        except sqlite3.Error:
+            # Broken connection: drop it, and hand its slot to the next checkout (or a thread already waiting)
+            try: conn.close()
+            except sqlite3.Error: pass
+            self._free_slot(); return
+        self._idle.put(conn)
+
+    def close_all(self):
+        """Closes every idle connection (checked-out ones close when released after this)."""
+        while True:
+            try: conn = self._idle.get_nowait()
+            except queue.Empty: break
+            if conn is not _FREE_SLOT: conn.close()
+            with self._lock:
+                self._open -= 1
+                if conn is _FREE_SLOT: self._free_slots -= 1
+
+    def stats(self):
+        with self._lock:
+            open_ = self._open - self._free_slots; idle = self._idle.qsize() - self._free_slots
+            return {"db_file": self.db_file, "size": self.size, "open": open_, "idle": idle, "in_use": open_ - idle,
+                    "checkouts": self._checkouts, "waits": self._waits, "created": self._created}
+
+class PooledConnection:
+    """Wraps a pooled sqlite3 connection; close() hands it back to the pool instead of closing it."""
+
+    def __init__(self, pool, conn):
+        self._pool = pool; self._conn = conn
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn); self._conn = None
+
+    def _live(self):
+        if self._conn is None: raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return self._conn
+
+    # Statements are timed (and slow ones logged) by metrics; with metrics disabled these are plain pass-throughs
+    def execute(self, sql, parameters=()):
+        if not metrics.ENABLED: return self._live().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not metrics.ENABLED: return self._live().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def cursor(self):
+        cursor = self._live().cursor()
+        return metrics.TimedCursor(cursor) if metrics.ENABLED else cursor
+
+    def __getattr__(self, attr):
+        return getattr(self._live(), attr)
+
+    # Same transaction semantics as sqlite3.Connection: commit on success, rollback on error
+    def __enter__(self): return self._conn.__enter__()
+    def __exit__(self, *exc): return self._conn.__exit__(*exc)
+
+    def __del__(self):
+        # Safety net for callers that forget close(); keeps the pool from leaking slots
+        try: self.close()
+        except Exception: pass
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Returns the process-wide pool, rebuilding it if DB_FILE has been changed. Set POOL_SIZE before the first call."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.db_file != DB_FILE:
+            if _pool is not None: _pool.close_all()
+            _pool = ConnectionPool(DB_FILE, POOL_SIZE)
+        return _pool
+
 def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Checks out a pooled connection to the SQLite database. Call close() to return it."""
+    pool = get_pool()
+    return PooledConnection(pool, pool.acquire())
+
+def get_pool_stats():
+    """Checkout/wait counters and open-connection gauges for the connection pool."""
+    return get_pool().stats()
 
 def create_tables():
     """Creates the destinations table with the new image_url column."""
@@ -50,94 +199,947 @@ def create_bookings_table():
     conn.commit()
     conn.close()
 
+# --- Generations ---
+# Per-dataset counters ("catalog", "distances", "users") stored in the generations table and bumped in the
+# same transaction as the write, so every process (Streamlit and api.py) sees every other process's edits.
+# Catalog writes also log the changed destination ids in catalog_changes so caches reload only those rows.
+GENERATION_TTL = 1.0           # Seconds a generation read from the DB is trusted; this process's own writes are seen at once
+CHANGE_LOG_GENERATIONS = 1000  # Catalog generations kept in catalog_changes; caches further behind do a full reload
+
+_generations = {}  # name -> (value, monotonic time read)
+
+def get_generation(name):
+    """Current generation of a dataset. Re-reads the DB at most every GENERATION_TTL seconds."""
+    cached = _generations.get(name); now = time.monotonic()
+    if cached is not None and now - cached[1] < GENERATION_TTL: return cached[0]
+    conn = get_db_connection()
+    try: row = conn.execute("SELECT value FROM generations WHERE name = ?", (name,)).fetchone()
+    finally: conn.close()
+    value = row[0] if row else 0
+    _generations[name] = (value, now)
+    return value
+
+def peek_generation(name):
+    """The generation of a dataset if a read younger than GENERATION_TTL is cached, else None. Never touches the DB."""
+    cached = _generations.get(name)
+    return cached[0] if cached is not None and time.monotonic() - cached[1] < GENERATION_TTL else None
+
+def _record_change(cursor, names, destination_ids=None):
+    """
+    Bumps the named generations inside the caller's open transaction. For "catalog", logs which
+    destinations changed; destination_ids=None logs a NULL row, meaning "reload everything".
+    """
+    cursor.execute(f"UPDATE generations SET value = value + 1 WHERE name IN ({', '.join('?' * len(names))})", names)
+    if "catalog" in names:
+        ids = [None] if destination_ids is None else list(destination_ids)
+        cursor.executemany("INSERT INTO catalog_changes (generation, destination_id) SELECT value, ? FROM generations WHERE name = 'catalog'", [(id,) for id in ids])
+        cursor.execute("DELETE FROM catalog_changes WHERE generation <= (SELECT value FROM generations WHERE name = 'catalog') - ?", (CHANGE_LOG_GENERATIONS,))
+
+def _forget_generations(names):
+    """Drops locally cached generations after a commit so this process sees its own write immediately."""
+    for name in names: _generations.pop(name, None)
+
+def _commit_change(conn, names, destination_ids=None):
+    _record_change(conn.cursor(), names, destination_ids); conn.commit(); _forget_generations(names)
+
+class CatalogCache:
+    """
+    In-process copy of the destinations table, keyed by id. Each read checks the catalog generation;
+    when it moved, only the destinations logged in catalog_changes since the cached generation are reloaded.
+    """
+
+    def __init__(self):
+        self._rows = {}; self._sorted = None; self._generation = None; self._lock = threading.Lock()
+        self.hits = self.misses = self.full_reloads = self.rows_reloaded = 0
+
+    def _load(self, conn, ids=None):
+        if ids is None:
+            self._rows = {row["id"]: dict(row) for row in conn.execute(f"SELECT {DESTINATION_COLUMNS} FROM destinations d")}
+            self.full_reloads += 1; self.rows_reloaded += len(self._rows); return
+        ids = list(ids)
+        for start in range(0, len(ids), 500):  # Stay well under SQLite's bound-parameter limit
+            chunk = ids[start:start + 500]
+            found = {row["id"]: dict(row) for row in conn.execute(f"SELECT {DESTINATION_COLUMNS} FROM destinations d WHERE d.id IN ({', '.join('?' * len(chunk))})", chunk)}
+            for id in chunk:
+                if id in found: self._rows[id] = found[id]
+                else: self._rows.pop(id, None)  # Deleted
+            self.rows_reloaded += len(found)
+
+    def _refresh(self):
+        generation = get_generation("catalog")
+        if generation == self._generation: self.hits += 1; return
+        with self._lock:
+            if generation == self._generation: self.hits += 1; return
+            self.misses += 1
+            conn = get_db_connection()
+            try:
+                changed = None
+                if self._generation is not None and generation - self._generation < CHANGE_LOG_GENERATIONS:
+                    changed = {row[0] for row in conn.execute("SELECT DISTINCT destination_id FROM catalog_changes WHERE generation > ? AND generation <= ?", (self._generation, generation))}
+                    if None in changed: changed = None  # A bulk write: reload everything
+                self._load(conn, changed); self._sorted = None; self._generation = generation
+            finally: conn.close()
+
+    def get(self, id):
+        self._refresh()
+        row = self._rows.get(id)
+        return dict(row) if row else None
+
+    def all(self):
+        self._refresh()
+        rows = self._sorted
+        if rows is None: rows = self._sorted = sorted(self._rows.values(), key=lambda d: (d["name"], d["id"]))
+        return [dict(row) for row in rows]
+
+    def clear(self):
+        with self._lock: self._rows = {}; self._sorted = None; self._generation = None
+
+    def stats(self):
+        return {"generation": self._generation, "rows": len(self._rows), "hits": self.hits, "misses": self.misses,
+                "full_reloads": self.full_reloads, "rows_reloaded": self.rows_reloaded}
+
+_catalog_cache = CatalogCache()
+
+def get_cache_stats():
+    """Hit/miss counters for the shared catalog cache plus the current generations."""
+    return {"catalog": _catalog_cache.stats(), "generations": {name: get_generation(name) for name in ("catalog", "distances", "users")}}
+
 # --- CRUD Functions for Destinations ---
 
 # --- CREATE ---
 # Added image_url parameter (now 5 arguments)
-def add_destination(name, region, highlights, cost, image_url):
+# Optional latitude/longitude let missing hub distances be computed (see pricing.compute_missing_distances)
+def add_destination(name, region, highlights, cost, image_url, latitude=None, longitude=None):
     conn = get_db_connection(); cursor = conn.cursor()
     try:
         # Added image_url column
-        cursor.execute("INSERT INTO destinations (name, region, highlights, cost, image_url) VALUES (?, ?, ?, ?, ?)", (name, region, highlights, cost, image_url))
-        conn.commit(); return True
+        cursor.execute("INSERT INTO destinations (name, region, highlights, cost, image_url, latitude, longitude) VALUES (?, ?, ?, ?, ?, ?, ?)", (name, region, highlights, cost, image_url, latitude, longitude))
+        _commit_change(conn, ("catalog", "distances"), [cursor.lastrowid]); return True
     except sqlite3.Error as e: print(f"DB err: {e}"); return False
     finally: conn.close()
 
 # --- READ ---
+DESTINATION_COLUMNS = "d.id, d.name, d.region, d.highlights, d.cost, d.image_url, d.latitude, d.longitude"
+
 def get_all_destinations():
-    conn = get_db_connection(); cursor = conn.cursor()
-    # Added image_url column to SELECT
-    cursor.execute("SELECT id, name, region, highlights, cost, image_url FROM destinations ORDER BY name")
-    destinations = cursor.fetchall(); conn.close()
-    return [dict(row) for row in destinations]
+    """Every destination ordered by name, served from the shared catalog cache."""
+    return _catalog_cache.all()
+
+def get_destination(id):
+    """One destination by id, or None. Served from the shared catalog cache."""
+    return _catalog_cache.get(id)
+
+# --- SEARCH ---
+# Sidebar search/filtering runs in SQLite: FTS5 (prefix-matched, bm25-ranked) over name/region/highlights,
+# plus indexes on (region, cost) and cost for the filters. destinations_fts is kept in sync by triggers.
+MAX_SEARCH_LIMIT = 200
+
+def _fts_query(text):
+    """Turns free text into an FTS5 query where every word is a quoted prefix term, e.g. 'maha str' -> '"maha"* "str"*'."""
+    return " ".join(f'"{token}"*' for token in re.findall(r"\w+", text or ""))
+
+def search_destinations_page(q=None, region=None, min_cost=None, max_cost=None, limit=24, offset=0, count=True):
+    """
+    One page of matching destinations plus the total match count: {"destinations", "total", "limit", "offset"}.
+    Best matches first when q is given, otherwise by name. Destinations sharing a name are collapsed
+    to the oldest one (lowest id) with GROUP BY, so pages never contain duplicates and the total counts names.
+    count=False skips the count query (total is then None unless this is the last page).
+    """
+    where, params = [], []
+    if region and region != "All": where.append("d.region = ?"); params.append(region)
+    if min_cost is not None: where.append("d.cost >= ?"); params.append(min_cost)
+    if max_cost is not None: where.append("d.cost <= ?"); params.append(max_cost)
+    match = _fts_query(q)
+    if match:
+        # bm25() only works in a plain FTS query, so the ranked hits are materialized before grouping
+        hits = "WITH hits AS MATERIALIZED (SELECT rowid AS id, bm25(destinations_fts, 10.0, 2.0, 1.0) AS rank FROM destinations_fts WHERE destinations_fts MATCH ?) "
+        source = "hits JOIN destinations d ON d.id = hits.id"; order = "hits.rank, d.name"  # Name hits outrank region/highlight hits
+        params.insert(0, match)
+    else:
+        hits = ""; source = "destinations d"; order = "d.name"  # Walks idx_destinations_name and stops after the page
+    filters = " WHERE " + " AND ".join(where) if where else ""
+    limit = max(1, min(int(limit), MAX_SEARCH_LIMIT)); offset = max(0, int(offset))
+    # With GROUP BY d.name, the bare columns come from the MIN(d.id) row (an SQLite guarantee)
+    columns = DESTINATION_COLUMNS.replace("d.id", "MIN(d.id) AS id", 1)
+    conn = get_db_connection()
+    try:
+        rows = [dict(row) for row in conn.execute(f"{hits}SELECT {columns} FROM {source}{filters} GROUP BY d.name ORDER BY {order} LIMIT ? OFFSET ?", params + [limit, offset])]
+        if rows and len(rows) < limit or not rows and offset == 0: total = offset + len(rows)  # Last page: no count needed
+        elif not count: total = None
+        else: total = conn.execute(f"{hits}SELECT COUNT(DISTINCT d.name) FROM {source}{filters}", params).fetchone()[0]
+    finally: conn.close()
+    return {"destinations": rows, "total": total, "limit": limit, "offset": offset}
+
+def search_destinations(q=None, region=None, min_cost=None, max_cost=None, limit=50, offset=0):
+    """Destinations matching the text query and filters (one per name); best matches first when q is given, otherwise by name."""
+    return search_destinations_page(q, region, min_cost, max_cost, limit, offset, count=False)["destinations"]
+
+def get_destination_facets():
+    """Region list and cost range for building the sidebar filters (both answered from indexes)."""
+    conn = get_db_connection()
+    try:
+        regions = [row[0] for row in conn.execute("SELECT DISTINCT region FROM destinations ORDER BY region")]
+        min_cost, max_cost = conn.execute("SELECT MIN(cost), MAX(cost) FROM destinations").fetchone()
+        return {"regions": regions, "min_cost": min_cost, "max_cost": max_cost}
+    finally: conn.close()
 
 # --- UPDATE ---
 # Added image_url parameter (now 6 arguments)
-def update_destination(id, name, region, highlights, cost, image_url):
+# Coordinates are only changed when passed
+def update_destination(id, name, region, highlights, cost, image_url, latitude=None, longitude=None):
     conn = get_db_connection(); cursor = conn.cursor()
     try:
         # Added image_url column
         cursor.execute("UPDATE destinations SET name = ?, region = ?, highlights = ?, cost = ?, image_url = ? WHERE id = ?", (name, region, highlights, cost, image_url, id))
-        conn.commit(); return True
+        if latitude is not None and longitude is not None:
+            cursor.execute("UPDATE destinations SET latitude = ?, longitude = ? WHERE id = ?", (latitude, longitude, id))
+            cursor.execute("DELETE FROM distances WHERE destination_id = ? AND source = 'computed'", (id,))  # Re-estimated from the new coordinates
+        _commit_change(conn, ("catalog", "distances"), [id]); return True
     except sqlite3.Error as e: print(f"DB err: {e}"); return False
     finally: conn.close()
 
 # --- DELETE ---
-# (No changes needed)
 def delete_destination(id):
     conn = get_db_connection(); cursor = conn.cursor()
-    try: cursor.execute("DELETE FROM destinations WHERE id = ?", (id,)); conn.commit(); return True
+    try:
+        cursor.execute("DELETE FROM distances WHERE destination_id = ?", (id,)); cursor.execute("DELETE FROM destinations WHERE id = ?", (id,))
+        _commit_change(conn, ("catalog", "distances"), [id]); return True
     except sqlite3.Error as e: print(f"DB err: {e}"); return False
     finally: conn.close()
 
-# --- Functions for Bookings ---
-# (save_booking and get_user_bookings remain the same)
-def save_booking(username, trip_details):
-    conn = get_db_connection(); cursor = conn.cursor()
+# --- BULK IMPORT ---
+# Upserts many destinations by name in one BEGIN IMMEDIATE transaction: a single name -> row lookup, then executemany
+# for the updates and inserts, and one generation bump for the whole batch.
+IMPORT_FIELDS = ("name", "region", "highlights", "cost", "image_url", "latitude", "longitude")
+MAX_IMPORT_ROWS = 100_000
+MAX_IMPORT_COST = 10_000_000  # ₹ p.p./day; anything above is a typo, and must stay far inside SQLite's 64-bit INTEGER
+IMPORT_BULK_ROWS = 1000  # Batches changing more rows than this rebuild their FTS entries in one pass and log one "reload everything" catalog change
+
+def _import_number(value, field, low=None, high=None):
+    if isinstance(value, str): value = value.strip()
+    if value is None or value == "": return None
+    try: number = float(value)
+    except (TypeError, ValueError): raise ValueError(f"{field} must be a number") from None
+    if number != number or (low is not None and number < low) or (high is not None and number > high): raise ValueError(f"{field} must be between {low} and {high}" if high is not None else f"{field} must be >= {low}")
+    return number
+
+def _clean_import_row(row):
+    """Validates one import row (a dict, e.g. from CSV or JSON). Returns the IMPORT_FIELDS values; raises ValueError."""
+    if not isinstance(row, dict): raise ValueError("row must be an object")
+    if None in row: raise ValueError("row has more values than the header")  # csv.DictReader files the extras under None
+    unknown = sorted(str(field) for field in set(row) - set(IMPORT_FIELDS) - {"id"})
+    if unknown: raise ValueError(f"unknown field(s): {', '.join(unknown)}")
+    text = {field: (str(row.get(field) or "")).strip() for field in ("name", "region", "highlights", "image_url")}
+    missing = [field for field in ("name", "region", "highlights") if not text[field]]
+    if missing: raise ValueError(f"missing {', '.join(missing)}")
+    cost = _import_number(row.get("cost"), "cost", 0, MAX_IMPORT_COST)
+    if cost is None: raise ValueError("missing cost")
+    if not cost.is_integer(): raise ValueError("cost must be a whole number of rupees")  # destinations.cost is INTEGER
+    latitude = _import_number(row.get("latitude"), "latitude", -90, 90); longitude = _import_number(row.get("longitude"), "longitude", -180, 180)
+    if (latitude is None) != (longitude is None): raise ValueError("latitude and longitude go together")
+    return (text["name"], text["region"], text["highlights"], int(cost), text["image_url"] or None, latitude, longitude)
+
+def parse_import_file(data, file_name):
+    """Rows (dicts) from an uploaded .csv (header row with IMPORT_FIELDS names) or .json (a list of objects) file."""
+    if isinstance(data, bytes): data = data.decode("utf-8-sig")
+    if file_name.lower().endswith(".json"):
+        rows = json.loads(data)
+        if not isinstance(rows, list): raise ValueError("JSON import must be a list of objects")
+        return rows
+    if file_name.lower().endswith(".csv"):
+        import csv
+        import io
+        try: return list(csv.DictReader(io.StringIO(data)))
+        except csv.Error as e: raise ValueError(f"invalid CSV: {e}") from None
+    raise ValueError("Import file must be .csv or .json")
+
+def import_destinations(rows, all_or_nothing=False):
+    """
+    Upserts destinations by name: an existing name has region, highlights and cost replaced (image URL and
+    coordinates only when given, on every row with that name); a new name is inserted. Invalid rows are
+    reported and skipped, or fail the whole batch with all_or_nothing. Returns {"inserted", "updated",
+    "unchanged", "errors": [{"index", "name", "error"}], "ids" (written), "images_changed" (ids whose
+    image URL changed)}, or None on a database error.
+    """
+    if len(rows) > MAX_IMPORT_ROWS: raise ValueError(f"At most {MAX_IMPORT_ROWS:,} rows per import")
+    cleaned = {}; errors = []
+    for i, row in enumerate(rows):
+        try:
+            values = _clean_import_row(row)
+            if values[0] in cleaned: raise ValueError(f"duplicate of row {cleaned[values[0]][0]}")
+            cleaned[values[0]] = (i, values)
+        except ValueError as e: errors.append({"index": i, "name": row.get("name") if isinstance(row, dict) else None, "error": str(e)})
+    report = {"inserted": 0, "updated": 0, "unchanged": 0, "errors": errors, "ids": [], "images_changed": []}
+    if not cleaned or (errors and all_or_nothing): return report
+
+    conn = get_db_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        existing = {}
+        for row in conn.execute("SELECT id, name, region, highlights, cost, image_url, latitude, longitude FROM destinations"):
+            existing.setdefault(row["name"], []).append(tuple(row))
+        updates = []; moved = []; retexted = {}; inserts = []; images_changed = []
+        for name, (_, (_, region, highlights, cost, image_url, latitude, longitude)) in cleaned.items():
+            if name not in existing: inserts.append((name, region, highlights, cost, image_url, latitude, longitude)); continue
+            for id, _, old_region, old_highlights, old_cost, old_image_url, old_latitude, old_longitude in existing[name]:
+                new = (region, highlights, cost, image_url or old_image_url, old_latitude if latitude is None else latitude, old_longitude if longitude is None else longitude)
+                if new == (old_region, old_highlights, old_cost, old_image_url, old_latitude, old_longitude): report["unchanged"] += 1; continue
+                updates.append(new + (id,))
+                if new[3] != old_image_url: images_changed.append(id)  # Cached thumbnails are stale
+                if new[4:] != (old_latitude, old_longitude): moved.append((id,))
+                if new[:2] != (old_region, old_highlights): retexted[id] = (name, old_region, old_highlights, region, highlights)
+        if not updates and not inserts: conn.rollback(); return report
+
+        bulk = len(updates) + len(inserts) > IMPORT_BULK_ROWS
+        if bulk:
+            # Index the batch in destinations_fts in one pass rather than through its per-row triggers (~3x faster at
+            # 50k rows). The triggers are dropped and recreated inside this transaction, so no other connection sees them gone.
+            triggers = [row[0] for row in conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name IN ('destinations_fts_insert', 'destinations_fts_update')")]
+            conn.execute("DROP TRIGGER destinations_fts_insert"); conn.execute("DROP TRIGGER destinations_fts_update")
+        # Rows whose region/highlights are unchanged leave them out of the SET, so the FTS update trigger skips them
+        conn.executemany("UPDATE destinations SET region = ?, highlights = ?, cost = ?, image_url = ?, latitude = ?, longitude = ? WHERE id = ?", [u for u in updates if u[-1] in retexted])
+        conn.executemany("UPDATE destinations SET cost = ?, image_url = ?, latitude = ?, longitude = ? WHERE id = ?", [u[2:] for u in updates if u[-1] not in retexted])
+        conn.executemany("DELETE FROM distances WHERE destination_id = ? AND source = 'computed'", moved)  # Re-estimated from the new coordinates
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM destinations").fetchone()[0]
+        conn.executemany("INSERT INTO destinations (name, region, highlights, cost, image_url, latitude, longitude) VALUES (?, ?, ?, ?, ?, ?, ?)", inserts)
+        inserted_ids = [row[0] for row in conn.execute("SELECT id FROM destinations WHERE id > ? ORDER BY id", (last_id,))]
+        if bulk:
+            conn.executemany("INSERT INTO destinations_fts (destinations_fts, rowid, name, region, highlights) VALUES ('delete', ?, ?, ?, ?)", [(id, name, region, highlights) for id, (name, region, highlights, _, _) in retexted.items()])
+            conn.executemany("INSERT INTO destinations_fts (rowid, name, region, highlights) VALUES (?, ?, ?, ?)", [(id, name, region, highlights) for id, (name, _, _, region, highlights) in retexted.items()])
+            conn.execute("INSERT INTO destinations_fts (rowid, name, region, highlights) SELECT id, name, region, highlights FROM destinations WHERE id > ?", (last_id,))
+            for sql in triggers: conn.execute(sql)
+        changed = [update[-1] for update in updates] + inserted_ids
+        _commit_change(conn, ("catalog", "distances"), None if bulk else changed)  # One generation bump; a bulk batch reloads caches in full
+        report.update(inserted=len(inserted_ids), updated=len(updates), ids=changed, images_changed=images_changed)
+        return report
+    except sqlite3.Error as e: conn.rollback(); print(f"DB err: {e}"); return None
+    finally: conn.close()
+
+# --- Hubs, Coordinates and Distances ---
+# One-way road distances (km) from each start hub to each destination live in the distances table.
+# pricing.get_distance_matrix() loads them once into a dense (hub x destination) array.
+def get_all_hubs():
+    conn = get_db_connection()
+    try: return [dict(row) for row in conn.execute("SELECT id, name, latitude, longitude FROM hubs ORDER BY name")]
+    finally: conn.close()
+
+def add_hub(name, latitude=None, longitude=None):
+    conn = get_db_connection()
+    try: conn.execute("INSERT INTO hubs (name, latitude, longitude) VALUES (?, ?, ?)", (name, latitude, longitude)); _commit_change(conn, ("distances",)); return True
+    except sqlite3.Error as e: print(f"DB err: {e}"); return False
+    finally: conn.close()
+
+def set_destination_coordinates(id, latitude, longitude):
+    conn = get_db_connection()
     try:
-        cursor.execute("""INSERT INTO bookings (username, start_city, destination_name, num_people, stay_days, transport_mode, total_budget) VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                       (username, trip_details.get('start_city'), trip_details.get('destination_name'), trip_details.get('num_people'), trip_details.get('stay_days'), trip_details.get('transport_mode'), trip_details.get('total_budget')))
-        conn.commit(); return True
-    except sqlite3.Error as e: print(f"Error saving booking: {e}"); return False
+        updated = conn.execute("UPDATE destinations SET latitude = ?, longitude = ? WHERE id = ?", (latitude, longitude, id)).rowcount
+        conn.execute("DELETE FROM distances WHERE destination_id = ? AND source = 'computed'", (id,))
+        _commit_change(conn, ("catalog", "distances"), [id]); return updated > 0
+    except sqlite3.Error as e: print(f"DB err: {e}"); return False
     finally: conn.close()
 
+def get_distance_data():
+    """Everything needed to build the distance matrix: hubs, destinations (with cost/coordinates) and known distances."""
+    conn = get_db_connection()
+    try:
+        hubs = [tuple(row) for row in conn.execute("SELECT id, name, latitude, longitude FROM hubs ORDER BY id")]
+        destinations = [tuple(row) for row in conn.execute("SELECT id, name, cost, latitude, longitude FROM destinations ORDER BY id")]
+        distances = conn.execute("SELECT hub_id, destination_id, distance_km FROM distances").fetchall()
+        return {"hubs": hubs, "destinations": destinations, "distances": [tuple(row) for row in distances]}
+    finally: conn.close()
+
+def save_distances(rows, source="computed"):
+    """Bulk-inserts (hub_id, destination_id, distance_km) rows, keeping any distance already stored. Returns rows written."""
+    conn = get_db_connection()
+    try:
+        cursor = conn.executemany("INSERT OR IGNORE INTO distances (hub_id, destination_id, distance_km, source) VALUES (?, ?, ?, ?)", [(h, d, km, source) for h, d, km in rows])
+        written = cursor.rowcount; _commit_change(conn, ("distances",)); return written
+    except sqlite3.Error as e: print(f"DB err: {e}"); return 0
+    finally: conn.close()
+
+def seed_hub_distances(cursor=None):
+    """
+    Loads the built-in hubs, destination coordinates and hub distances. Safe to run repeatedly.
+    With a cursor the caller owns the transaction (and any generation bump).
+    """
+    conn = None
+    if cursor is None: conn = get_db_connection(); cursor = conn.cursor()
+    try:
+        cursor.executemany("INSERT OR IGNORE INTO hubs (name, latitude, longitude) VALUES (?, ?, ?)", [(hub, lat, lon) for hub, (lat, lon) in SEED_HUB_COORDINATES.items()])
+        cursor.executemany("UPDATE destinations SET latitude = ?, longitude = ? WHERE name = ? AND latitude IS NULL", [(lat, lon, name) for name, (lat, lon) in SEED_DESTINATION_COORDINATES.items()])
+        cursor.executemany("""INSERT OR IGNORE INTO distances (hub_id, destination_id, distance_km, source)
+                              SELECT h.id, d.id, ?, 'seed' FROM hubs h JOIN destinations d ON d.name = ? WHERE h.name = ?""",
+                           [(km, dest, hub) for hub, dests in SEED_HUB_DISTANCES.items() for dest, km in dests.items()])
+        if conn is not None: _commit_change(conn, ("catalog", "distances"))
+    finally:
+        if conn is not None: conn.close()
+
+# --- Functions for Bookings ---
+# Bookings go through a group-commit writer: concurrent save_booking() calls are coalesced into
+# one transaction (one executemany, one fsync) instead of each taking the write lock on its own.
+BOOKING_BATCH_MAX = 128        # Most bookings committed in one transaction
+BOOKING_BATCH_LATENCY = 0.005  # Seconds the writer waits for more bookings before committing
+BOOKING_SAVE_TIMEOUT = 30.0    # Seconds save_booking() waits for its batch to commit
+BOOKING_PENDING = None         # save_booking() result when the booking was already committing at the timeout: it may or may not be saved
+BOOKING_ROW_ERRORS = (sqlite3.IntegrityError, sqlite3.InterfaceError, sqlite3.DataError, sqlite3.ProgrammingError)  # Caused by one booking's values, not by the database
+INSERT_BOOKING_SQL = "INSERT INTO bookings (username, start_city, destination_name, num_people, stay_days, transport_mode, total_budget) VALUES (?, ?, ?, ?, ?, ?, ?)"
+
+def _booking_row(username, trip_details):
+    if not username: raise ValueError("Booking needs a username")
+    return (username, trip_details.get('start_city'), trip_details.get('destination_name'), trip_details.get('num_people'), trip_details.get('stay_days'), trip_details.get('transport_mode'), trip_details.get('total_budget'))
+
+class BookingWriter:
+    """Background thread that commits queued bookings in batches and resolves one Future per booking."""
+
+    def __init__(self, max_batch=BOOKING_BATCH_MAX, max_latency=BOOKING_BATCH_LATENCY):
+        self.max_batch = max_batch; self.max_latency = max_latency
+        self._queue = queue.Queue(); self._thread = None; self._lock = threading.Lock()
+        self._batches = 0; self._committed = 0; self._failed = 0; self._largest_batch = 0
+
+    def submit(self, username, trip_details):
+        """Queues a booking. The returned Future resolves to True once committed, or raises its error."""
+        future = Future()
+        try: row = _booking_row(username, trip_details)
+        except ValueError as e: future.set_exception(e); return future
+        self._ensure_running(); self._queue.put((row, future))
+        return future
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="tripwala-booking-writer", daemon=True); self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try: batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty: break
+            # Withdrawn (cancelled) bookings are dropped; once running, a future can no longer be cancelled
+            batch = [(row, future) for row, future in batch if future.set_running_or_notify_cancel()]
+            if not batch: continue
+            try: self._commit(batch)
+            except Exception as e:  # Never let the writer die with callers still waiting
+                for _, future in batch:
+                    if not future.done(): future.set_exception(e)
+
+    def _commit(self, batch):
+        conn = get_db_connection()
+        try:
+            try:
+                conn.execute("BEGIN IMMEDIATE"); last_id = _last_booking_id(conn)
+                conn.executemany(INSERT_BOOKING_SQL, [row for row, _ in batch]); _apply_rollups(conn, last_id); conn.commit()
+                for _, future in batch: future.set_result(True)
+                self._record(len(batch), 0)
+            except BOOKING_ROW_ERRORS:
+                conn.rollback()
+                # Something in the batch is bad: retry row by row so only the offending bookings fail
+                failed = 0
+                for i, (row, future) in enumerate(batch):
+                    try:
+                        conn.execute("BEGIN IMMEDIATE"); last_id = _last_booking_id(conn)
+                        conn.execute(INSERT_BOOKING_SQL, row); _apply_rollups(conn, last_id); conn.commit(); future.set_result(True)
+                    except BOOKING_ROW_ERRORS as e: conn.rollback(); failed += 1; future.set_exception(e)
+                    except sqlite3.Error as e: conn.rollback(); self._fail(batch[i:], e); failed += len(batch) - i; break
+                self._record(len(batch), failed)
+            except sqlite3.Error as e:
+                # Locked or broken database (OperationalError): fail the batch at once; retrying row by row
+                # would wait out one busy timeout per booking with the writer thread stuck the whole time
+                conn.rollback(); self._fail(batch, e); self._record(len(batch), len(batch))
+        finally: conn.close()
+
+    def _fail(self, batch, error):
+        for _, future in batch: future.set_exception(error)
+
+    def _record(self, size, failed):
+        with self._lock:
+            self._batches += 1; self._committed += size - failed; self._failed += failed; self._largest_batch = max(self._largest_batch, size)
+
+    def stats(self):
+        with self._lock:
+            return {"batches": self._batches, "committed": self._committed, "failed": self._failed, "largest_batch": self._largest_batch, "queued": self._queue.qsize()}
+
+_booking_writer = BookingWriter()
+
+def submit_booking(username, trip_details):
+    """Non-blocking save: returns a concurrent.futures.Future for the booking's commit."""
+    return _booking_writer.submit(username, trip_details)
+
+def _await_booking(future):
+    """Waits for a queued booking. On timeout it is withdrawn if still queued (a plain failure), else BOOKING_PENDING."""
+    try: return future.result(timeout=BOOKING_SAVE_TIMEOUT)
+    except TimeoutError:
+        if future.cancel(): raise TimeoutError(f"Booking not saved: writer busy for {BOOKING_SAVE_TIMEOUT}s") from None
+        return BOOKING_PENDING
+
+def save_booking(username, trip_details):
+    """
+    True once committed, False if it failed (nothing saved; safe to retry), or BOOKING_PENDING
+    if it timed out mid-commit: it may still be saved, so check the user's bookings before retrying.
+    """
+    try: return _await_booking(submit_booking(username, trip_details))
+    except (sqlite3.Error, ValueError, TimeoutError) as e: print(f"Error saving booking: {e}"); return False
+
+def save_bookings(bookings):
+    """Saves (username, trip_details) pairs together. Returns one result per booking: True, BOOKING_PENDING (see save_booking), or the error message."""
+    futures = [submit_booking(username, trip_details) for username, trip_details in bookings]
+    results = []
+    for future in futures:
+        try: results.append(_await_booking(future))
+        except (sqlite3.Error, ValueError, TimeoutError) as e: results.append(str(e) or type(e).__name__)
+    return results
+
+def get_booking_writer_stats():
+    return _booking_writer.stats()
+
+BOOKING_COLUMNS = "id, start_city, destination_name, num_people, stay_days, transport_mode, total_budget, booking_timestamp"
+
 def get_user_bookings(username):
     conn = get_db_connection(); cursor = conn.cursor()
-    cursor.execute("SELECT id, start_city, destination_name, num_people, stay_days, transport_mode, total_budget, booking_timestamp FROM bookings WHERE username = ? ORDER BY booking_timestamp DESC", (username,))
+    cursor.execute(f"SELECT {BOOKING_COLUMNS} FROM bookings WHERE username = ? ORDER BY booking_timestamp DESC, id DESC", (username,))
     bookings = cursor.fetchall(); conn.close()
     return [dict(row) for row in bookings]
 
+# --- Keyset Pagination for Bookings ---
+# A cursor encodes the (booking_timestamp, id) of the last row on a page, so the next
+# page is an index range seek on idx_bookings_user_time instead of an OFFSET scan.
+MAX_BOOKINGS_PAGE_SIZE = 100
+
+def encode_booking_cursor(booking_timestamp, booking_id):
+    return base64.urlsafe_b64encode(f"{booking_timestamp}|{booking_id}".encode()).decode()
+
+def decode_booking_cursor(cursor):
+    """Returns (booking_timestamp, id) for a cursor, raising ValueError if it is malformed."""
+    try:
+        booking_timestamp, booking_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return booking_timestamp, int(booking_id)
+    except Exception as e: raise ValueError(f"Invalid bookings cursor: {cursor!r}") from e
+
+def get_user_bookings_page(username, limit=20, before=None):
+    """Returns one page of a user's bookings (newest first) plus the cursor for the next page, or None if this is the last."""
+    limit = max(1, min(int(limit), MAX_BOOKINGS_PAGE_SIZE))
+    sql = f"SELECT {BOOKING_COLUMNS} FROM bookings WHERE username = ?"; params = [username]
+    if before:
+        sql += " AND (booking_timestamp, id) < (?, ?)"; params.extend(decode_booking_cursor(before))
+    sql += " ORDER BY booking_timestamp DESC, id DESC LIMIT ?"; params.append(limit + 1)  # One extra row tells us if there's a next page
+    conn = get_db_connection()
+    try: rows = conn.execute(sql, params).fetchall()
+    finally: conn.close()
+    bookings = [dict(row) for row in rows[:limit]]
+    next_cursor = encode_booking_cursor(bookings[-1]["booking_timestamp"], bookings[-1]["id"]) if len(rows) > limit else None
+    return {"bookings": bookings, "next_cursor": next_cursor}
+
+# --- Booking Analytics Rollups ---
+# Daily and all-time totals per destination, start city and transport mode, plus all-time totals per route,
+# kept in small rollup tables. The booking writer folds every committed batch into them in the same transaction,
+# so date-bounded reports read (days x keys) rows and all-time ones (keys) rows no matter how many bookings
+# exist. rebuild_rollups() backfills.
+ROLLUP_DIMENSIONS = {
+    "destination": ("booking_daily_destination", "destination_name"),
+    "start_city": ("booking_daily_start_city", "start_city"),
+    "transport_mode": ("booking_daily_transport_mode", "transport_mode"),
+}
+ROLLUP_TOTAL_TABLES = {"destination": "booking_totals_destination", "start_city": "booking_totals_start_city", "transport_mode": "booking_totals_transport_mode"}
+ROUTE_ROLLUP_TABLE = "booking_routes"
+MAX_ANALYTICS_LIMIT = 100
+
+def _rollup_upsert(table, keys, key_exprs, after_id):
+    """SQL that aggregates bookings with id > ? and adds the counts onto the rollup table's existing rows."""
+    return f"""INSERT INTO {table} ({", ".join(keys)}, bookings, travellers, revenue)
+               SELECT {", ".join(key_exprs)}, COUNT(*), COALESCE(SUM(num_people), 0), COALESCE(SUM(total_budget), 0)
+               FROM bookings WHERE id > {int(after_id)} GROUP BY {", ".join(str(i + 1) for i in range(len(keys)))}
+               ON CONFLICT ({", ".join(keys)}) DO UPDATE SET bookings = bookings + excluded.bookings,
+                   travellers = travellers + excluded.travellers, revenue = revenue + excluded.revenue"""
+
+def _last_booking_id(conn):
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM bookings").fetchone()[0]
+
+def _apply_rollups(conn, after_id):
+    """
+    Adds every booking with id > after_id to the rollups. Call inside the write transaction that inserted
+    them (BEGIN IMMEDIATE holds the write lock, so those ids are exactly this transaction's rows).
+    """
+    for table, column in ROLLUP_DIMENSIONS.values():
+        conn.execute(_rollup_upsert(table, ("day", column), ("date(booking_timestamp)", f"COALESCE({column}, '')"), after_id))
+    _apply_total_rollups(conn, after_id)
+    conn.execute(_rollup_upsert(ROUTE_ROLLUP_TABLE, ("start_city", "destination_name"), ("COALESCE(start_city, '')", "COALESCE(destination_name, '')"), after_id))
+
+def _apply_total_rollups(conn, after_id):
+    for dimension, table in ROLLUP_TOTAL_TABLES.items():
+        column = ROLLUP_DIMENSIONS[dimension][1]; conn.execute(_rollup_upsert(table, (column,), (f"COALESCE({column}, '')",), after_id))
+
+def _create_rollup_tables(cursor):
+    for table, column in ROLLUP_DIMENSIONS.values():
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS {table} (day TEXT NOT NULL, {column} TEXT NOT NULL, bookings INTEGER NOT NULL,
+                           travellers INTEGER NOT NULL, revenue REAL NOT NULL, PRIMARY KEY (day, {column})) WITHOUT ROWID""")
+    for dimension, table in ROLLUP_TOTAL_TABLES.items():
+        column = ROLLUP_DIMENSIONS[dimension][1]
+        cursor.execute(f"""CREATE TABLE IF NOT EXISTS {table} ({column} TEXT NOT NULL PRIMARY KEY, bookings INTEGER NOT NULL,
+                           travellers INTEGER NOT NULL, revenue REAL NOT NULL) WITHOUT ROWID""")
+    cursor.execute(f"""CREATE TABLE IF NOT EXISTS {ROUTE_ROLLUP_TABLE} (start_city TEXT NOT NULL, destination_name TEXT NOT NULL, bookings INTEGER NOT NULL,
+                       travellers INTEGER NOT NULL, revenue REAL NOT NULL, PRIMARY KEY (start_city, destination_name)) WITHOUT ROWID""")
+
+def rebuild_rollups():
+    """Recomputes every rollup table from the raw bookings in one transaction. Returns bookings counted."""
+    conn = get_db_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for table in [table for table, _ in ROLLUP_DIMENSIONS.values()] + list(ROLLUP_TOTAL_TABLES.values()) + [ROUTE_ROLLUP_TABLE]: conn.execute(f"DELETE FROM {table}")
+            _apply_rollups(conn, 0); counted = conn.execute("SELECT COUNT(*) FROM bookings").fetchone()[0]
+            conn.commit(); return counted
+        except Exception: conn.rollback(); raise
+    finally: conn.close()
+
+def _rollup_table(dimension):
+    if dimension not in ROLLUP_DIMENSIONS: raise ValueError(f"dimension must be one of {', '.join(ROLLUP_DIMENSIONS)}")
+    return ROLLUP_DIMENSIONS[dimension]
+
+def _day_range(start, end):
+    where, params = [], []
+    if start: where.append("day >= ?"); params.append(str(start))
+    if end: where.append("day <= ?"); params.append(str(end))
+    return (" WHERE " + " AND ".join(where) if where else ""), params
+
+def get_daily_totals(start=None, end=None):
+    """[{day, bookings, travellers, revenue}] across all destinations, oldest day first. Days are 'YYYY-MM-DD' (UTC)."""
+    table, _ = ROLLUP_DIMENSIONS["destination"]; where, params = _day_range(start, end)
+    conn = get_db_connection()
+    try: return [dict(row) for row in conn.execute(f"SELECT day, SUM(bookings) AS bookings, SUM(travellers) AS travellers, SUM(revenue) AS revenue FROM {table}{where} GROUP BY day ORDER BY day", params)]
+    finally: conn.close()
+
+def get_daily_rollup(dimension, start=None, end=None):
+    """[{day, key, bookings, travellers, revenue}] for one dimension ("destination", "start_city" or "transport_mode")."""
+    table, column = _rollup_table(dimension); where, params = _day_range(start, end)
+    conn = get_db_connection()
+    try: return [dict(row) for row in conn.execute(f"SELECT day, {column} AS key, bookings, travellers, revenue FROM {table}{where} ORDER BY day, {column}", params)]
+    finally: conn.close()
+
+def get_top_by(dimension, start=None, end=None, limit=10):
+    """Keys of a dimension ranked by revenue over the date range (all time without one): [{key, bookings, travellers, revenue}]."""
+    table, column = _rollup_table(dimension); where, params = _day_range(start, end)
+    if not where: table = ROLLUP_TOTAL_TABLES[dimension]  # One row per key, already summed: no GROUP BY over every day
+    conn = get_db_connection()
+    try:
+        return [dict(row) for row in conn.execute(f"""SELECT {column} AS key, SUM(bookings) AS bookings, SUM(travellers) AS travellers, SUM(revenue) AS revenue
+                                                      FROM {table}{where} GROUP BY {column} ORDER BY revenue DESC, bookings DESC LIMIT ?""",
+                                                   params + [max(1, min(int(limit), MAX_ANALYTICS_LIMIT))])]
+    finally: conn.close()
+
+def get_top_routes(limit=10):
+    """Most booked start_city -> destination routes (all time): [{start_city, destination_name, bookings, travellers, revenue}]."""
+    conn = get_db_connection()
+    try:
+        return [dict(row) for row in conn.execute(f"SELECT start_city, destination_name, bookings, travellers, revenue FROM {ROUTE_ROLLUP_TABLE} ORDER BY bookings DESC, revenue DESC LIMIT ?",
+                                                   (max(1, min(int(limit), MAX_ANALYTICS_LIMIT)),))]
+    finally: conn.close()
+
+# --- Streaming Exports ---
+# Rows come out in fetchmany() chunks from one open cursor, so an export of any size holds at most
+# EXPORT_CHUNK_ROWS rows in memory. The generator keeps its pooled connection until it is exhausted or closed.
+EXPORT_CHUNK_ROWS = 5000
+BOOKING_EXPORT_COLUMNS = ("id", "username", "start_city", "destination_name", "num_people", "stay_days", "transport_mode", "total_budget", "booking_timestamp")
+DESTINATION_EXPORT_COLUMNS = ("id", "name", "region", "highlights", "cost", "image_url", "latitude", "longitude")
+
+def _iter_chunks(sql, params, chunk_size):
+    conn = get_db_connection()
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows: break
+            yield [tuple(row) for row in rows]
+    finally: conn.close()
+
+def iter_bookings(username=None, start=None, end=None, chunk_size=EXPORT_CHUNK_ROWS):
+    """
+    Yields bookings as lists of BOOKING_EXPORT_COLUMNS tuples, oldest first, optionally for one user
+    and/or booked between the start and end dates (inclusive, 'YYYY-MM-DD' or datetime.date, UTC).
+    """
+    where, params = [], []
+    if username: where.append("username = ?"); params.append(username)
+    if start: where.append("booking_timestamp >= ?"); params.append(str(start))
+    if end: where.append("booking_timestamp < ?"); params.append((datetime.date.fromisoformat(str(end)) + datetime.timedelta(days=1)).isoformat())
+    sql = f"SELECT {', '.join(BOOKING_EXPORT_COLUMNS)} FROM bookings" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY id"
+    return _iter_chunks(sql, params, chunk_size)
+
+def iter_destinations(chunk_size=EXPORT_CHUNK_ROWS):
+    """Yields the whole catalog as lists of DESTINATION_EXPORT_COLUMNS tuples, in id order."""
+    return _iter_chunks(f"SELECT {', '.join(DESTINATION_EXPORT_COLUMNS)} FROM destinations ORDER BY id", (), chunk_size)
+
+# --- Users ---
+# Credentials live in the users table (imported once from config.yaml). get_credentials() serves the
+# streamlit-authenticator credential map from an in-process cache that add_user() invalidates.
+CONFIG_FILE = "config.yaml"
+USER_FIELDS = ("email", "first_name", "last_name", "name", "password_hint")
+
+_credentials_cache = {"generation": None, "credentials": None}
+
+def _hash_password(password):
+    import bcrypt
+    if password.startswith(("$2a$", "$2b$", "$2y$")): return password  # Already a bcrypt hash
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+
+def _user_row(username, user):
+    roles = user.get("roles")
+    return (username.lower(), user.get("email"), user.get("first_name"), user.get("last_name"), user.get("name"),
+            _hash_password(user["password"]), user.get("password_hint"), json.dumps(roles) if roles is not None else None)
+
+INSERT_USER_SQL = "INSERT INTO users (username, email, first_name, last_name, name, password_hash, password_hint, roles) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+
+def add_user(username, user):
+    """Inserts one registered user (a streamlit-authenticator credentials entry). False if the username/email is taken."""
+    conn = get_db_connection()
+    try: conn.execute(INSERT_USER_SQL, _user_row(username, user)); _commit_change(conn, ("users",)); return True
+    except sqlite3.Error as e:
+        print(f"DB err: {e}"); _credentials_cache["generation"] = None  # Rebuild: drops a rejected entry the authenticator added in memory
+        return False
+    finally: conn.close()
+
+def import_users_from_yaml(path=CONFIG_FILE, cursor=None):
+    """
+    One-time import of config.yaml credentials; users already in the table are skipped. Returns rows imported.
+    With a cursor the caller owns the transaction (and any generation bump).
+    """
+    if not os.path.exists(path): return 0
+    import yaml
+    with open(path) as file: config = yaml.safe_load(file) or {}
+    users = (config.get("credentials") or {}).get("usernames") or {}
+    conn = None
+    if cursor is None: conn = get_db_connection(); cursor = conn.cursor()
+    try:
+        cursor.executemany(INSERT_USER_SQL.replace("INSERT", "INSERT OR IGNORE", 1), [_user_row(username, user) for username, user in users.items() if user.get("password")])
+        imported = cursor.rowcount
+        if conn is not None: _commit_change(conn, ("users",))
+        return imported
+    finally:
+        if conn is not None: conn.close()
+
+def get_credentials():
+    """
+    The {'usernames': {...}} credential map for streamlit-authenticator, rebuilt only after a user is added.
+    The dict is shared in-process (like the authenticator's own config-file mode), so login flags persist across reruns.
+    """
+    generation = get_generation("users")
+    if _credentials_cache["generation"] != generation:
+        conn = get_db_connection()
+        try: rows = conn.execute("SELECT username, email, first_name, last_name, name, password_hash, password_hint, roles FROM users").fetchall()
+        finally: conn.close()
+        usernames = {}
+        for row in rows:
+            user = {field: row[field] for field in USER_FIELDS if row[field] is not None}
+            user["password"] = row["password_hash"]; user["roles"] = json.loads(row["roles"]) if row["roles"] else None; user["logged_in"] = False
+            usernames[row["username"]] = user
+        _credentials_cache.update(generation=generation, credentials={"usernames": usernames})
+    return _credentials_cache["credentials"]
+
+# --- Schema Migrations ---
+# Ordered (version, description, function) steps; PRAGMA user_version records the last one applied.
+def _migration_bookings_user_index(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_bookings_user_time ON bookings (username, booking_timestamp, id)")
+
+def _migration_hub_distances(cursor):
+    cursor.execute("ALTER TABLE destinations ADD COLUMN latitude REAL")
+    cursor.execute("ALTER TABLE destinations ADD COLUMN longitude REAL")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS hubs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE,
+        latitude REAL,
+        longitude REAL
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS distances (
+        hub_id INTEGER NOT NULL,
+        destination_id INTEGER NOT NULL,
+        distance_km REAL NOT NULL,
+        source TEXT,  -- 'seed', 'computed' or 'manual'
+        PRIMARY KEY (hub_id, destination_id)
+    ) WITHOUT ROWID
+    """)
+    seed_hub_distances(cursor)
+
+def _migration_destination_search(cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_destinations_name ON destinations (name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_destinations_cost ON destinations (cost)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_destinations_region_cost ON destinations (region, cost)")
+    cursor.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS destinations_fts USING fts5 (
+        name, region, highlights,
+        content = 'destinations', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """)
+    # External-content FTS: triggers mirror every insert/update/delete on destinations
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS destinations_fts_insert AFTER INSERT ON destinations BEGIN
+        INSERT INTO destinations_fts (rowid, name, region, highlights) VALUES (new.id, new.name, new.region, new.highlights);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS destinations_fts_delete AFTER DELETE ON destinations BEGIN
+        INSERT INTO destinations_fts (destinations_fts, rowid, name, region, highlights) VALUES ('delete', old.id, old.name, old.region, old.highlights);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS destinations_fts_update AFTER UPDATE OF name, region, highlights ON destinations BEGIN
+        INSERT INTO destinations_fts (destinations_fts, rowid, name, region, highlights) VALUES ('delete', old.id, old.name, old.region, old.highlights);
+        INSERT INTO destinations_fts (rowid, name, region, highlights) VALUES (new.id, new.name, new.region, new.highlights);
+    END
+    """)
+    cursor.execute("INSERT INTO destinations_fts (destinations_fts) VALUES ('rebuild')")
+
+def _migration_users(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        email TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        name TEXT,
+        password_hash TEXT NOT NULL,
+        password_hint TEXT,
+        roles TEXT,  -- JSON list or NULL
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users (username COLLATE NOCASE)")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users (email COLLATE NOCASE)")
+    import_users_from_yaml(cursor=cursor)
+
+def _migration_destination_image_url(cursor):
+    # Databases created before image_url existed used to need deleting; upgrade them in place instead
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(destinations)")]
+    if "image_url" not in columns: cursor.execute("ALTER TABLE destinations ADD COLUMN image_url TEXT")
+
+def _migration_generations(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS generations (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0) WITHOUT ROWID")
+    cursor.executemany("INSERT OR IGNORE INTO generations (name, value) VALUES (?, 1)", [("catalog",), ("distances",), ("users",)])
+    cursor.execute("CREATE TABLE IF NOT EXISTS catalog_changes (generation INTEGER NOT NULL, destination_id INTEGER)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_catalog_changes_generation ON catalog_changes (generation)")
+
+def _migration_booking_rollups(cursor):
+    _create_rollup_tables(cursor)
+    _apply_rollups(cursor, 0)  # Backfill from the bookings already stored
+
+def _migration_booking_total_rollups(cursor):
+    _create_rollup_tables(cursor)
+    for table in ROLLUP_TOTAL_TABLES.values(): cursor.execute(f"DELETE FROM {table}")  # Migration 7 may have filled them already on a new database
+    _apply_total_rollups(cursor, 0)
+
+MIGRATIONS = [
+    (1, "Index bookings by (username, booking_timestamp, id)", _migration_bookings_user_index),
+    (2, "Hubs, coordinates and hub-to-destination distances", _migration_hub_distances),
+    (3, "Full-text search and filter indexes for destinations", _migration_destination_search),
+    (4, "Users table, imported from config.yaml", _migration_users),
+    (5, "Add destinations.image_url to pre-image databases", _migration_destination_image_url),
+    (6, "Generation counters and catalog change log for cross-process caches", _migration_generations),
+    (7, "Daily booking rollups per destination, start city and transport mode, plus route totals", _migration_booking_rollups),
+    (8, "All-time booking totals per destination, start city and transport mode", _migration_booking_total_rollups),
+]
+
+def run_migrations():
+    """
+    Applies any migrations newer than the database's user_version, each in its own transaction.
+    Process-safe: BEGIN IMMEDIATE takes the write lock, then user_version is re-read, so when two
+    processes start together the second one skips whatever the first already applied.
+    """
+    conn = get_db_connection()
+    try:
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        for version, description, migrate in MIGRATIONS:
+            if version <= current: continue
+            conn.execute("BEGIN IMMEDIATE")  # Explicit transaction so DDL and the version bump commit together
+            try:
+                current = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version <= current: conn.rollback(); continue  # Applied by another process while we waited
+                migrate(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {version}")
+                conn.commit()
+            except Exception: conn.rollback(); raise
+            print(f"Applied migration {version}: {description}")
+    finally: conn.close()
+
+# --- Database Initialization ---
+_initialized = set()  # DB files already set up by this process
+_init_lock = threading.Lock()
+
+def initialize_database():
+    """
+    Creates tables, applies migrations and seeds sample data -- once per process per DB_FILE.
+    Cheap to call on every Streamlit rerun: after the first call it is a set lookup.
+    """
+    if DB_FILE in _initialized: return
+    with _init_lock:
+        if DB_FILE in _initialized: return
+        create_tables(); create_bookings_table(); run_migrations(); populate_database_if_empty()
+        _initialized.add(DB_FILE)
+
+# --- Seed Data ---
+# Sample destinations (name, region, highlights, cost, image_url)
+SAMPLE_DESTINATIONS = [
+    ("Matheran", "Maharashtra", "Hill Station, Viewpoints, Toy Train", 800, "https://upload.wikimedia.org/wikipedia/commons/thumb/d/d3/Matheran_Hills.jpg/1024px-Matheran_Hills.jpg"),
+    ("Konkan", "Maharashtra", "Beaches, Forts, Seafood (Ratnagiri)", 400, "https://upload.wikimedia.org/wikipedia/commons/thumb/a/a7/Ratnagiri_fort.jpg/1024px-Ratnagiri_fort.jpg"),
+    ("Malshej Ghat", "Maharashtra", "Waterfalls, Monsoon destination, Hiking", 580, "https://upload.wikimedia.org/wikipedia/commons/thumb/8/86/Malshej_Ghat_3.jpg/1024px-Malshej_Ghat_3.jpg"),
+    ("Mumbai", "Maharashtra", "Gateway of India, Marine Drive, Bollywood", 700, "https://upload.wikimedia.org/wikipedia/commons/thumb/7/7b/Mumbai_Skyline_at_Night.jpg/1024px-Mumbai_Skyline_at_Night.jpg"),
+    ("Pune", "Maharashtra", "Shaniwar Wada, Aga Khan Palace, Osho Ashram", 450, "https://upload.wikimedia.org/wikipedia/commons/thumb/8/8c/Shaniwar_wada_main_gate.jpg/1024px-Shaniwar_wada_main_gate.jpg"),
+    ("Lonavala & Khandala", "Maharashtra", "Hill stations, Caves, Chikki", 550, "https://upload.wikimedia.org/wikipedia/commons/thumb/c/c5/Bhaja_Caves_near_Lonavla_India.jpg/1024px-Bhaja_Caves_near_Lonavla_India.jpg"),
+    ("Mahabaleshwar", "Maharashtra", "Strawberry farms, Venna Lake, Viewpoints", 500, "https://upload.wikimedia.org/wikipedia/commons/thumb/a/af/Connaught_Peak_in_Mahabaleshwar.jpg/1024px-Connaught_Peak_in_Mahabaleshwar.jpg"),
+    ("Chhatrapati Sambhaji Nagar", "Maharashtra", "Ajanta & Ellora Caves, Bibi Ka Maqbara", 550, "https://upload.wikimedia.org/wikipedia/commons/thumb/d/d1/Bibi_Ka_Maqbara_Aurangabad.jpg/1024px-Bibi_Ka_Maqbara_Aurangabad.jpg"),
+    ("Nashik", "Maharashtra", "Vineyards, Sula Fest, Trimbakeshwar Temple", 480, "https://upload.wikimedia.org/wikipedia/commons/thumb/f/f0/Sula_Vineyards_Nashik_India.jpg/1024px-Sula_Vineyards_Nashik_India.jpg"),
+    ("Alibaug", "Maharashtra", "Beaches, Forts, Water sports", 420, "https://upload.wikimedia.org/wikipedia/commons/thumb/a/a9/Kolaba_Fort_at_Alibaug_20170313_150824.jpg/1024px-Kolaba_Fort_at_Alibaug_20170313_150824.jpg"),
+    ("Shirdi", "Maharashtra", "Sai Baba Temple, Pilgrimage site", 550, "https://upload.wikimedia.org/wikipedia/commons/thumb/1/13/Shirdi_Sai_Temple.jpg/1024px-Shirdi_Sai_Temple.jpg"),
+    ("Tadoba National Park", "Maharashtra", "Tiger Safari, Wildlife, Jungle", 800, "https://upload.wikimedia.org/wikipedia/commons/thumb/1/1a/Tadoba_Tiger.jpg/1024px-Tadoba_Tiger.jpg"),
+    ("Ganpatipule", "Maharashtra", "Swayambhu Ganesh Temple, Pristine Beach", 480, "https://upload.wikimedia.org/wikipedia/commons/thumb/3/3d/Ganpatipule_temple_and_sea_shore.jpg/1024px-Ganpatipule_temple_and_sea_shore.jpg"),
+    ("Kolhapur", "Maharashtra", "Mahalakshmi Temple, Panhala Fort, Cuisine", 300, "https://upload.wikimedia.org/wikipedia/commons/thumb/9/90/Mahalaxmi_temple_Kolhapur.jpg/1024px-Mahalaxmi_temple_Kolhapur.jpg"),
+    ("Tarkarli", "Maharashtra", "Scuba Diving, Snorkeling, Malvan coast", 650, "https://upload.wikimedia.org/wikipedia/commons/thumb/b/be/Tarkarli_Beach_2.jpg/1024px-Tarkarli_Beach_2.jpg"),
+    ("Panchgani", "Maharashtra", "Table Land, Paragliding, Mapro Garden", 490, "https://upload.wikimedia.org/wikipedia/commons/thumb/a/a9/Table_Land_Panchgani_2.jpg/1024px-Table_Land_Panchgani_2.jpg"),
+    ("Raigad Fort", "Maharashtra", "Maratha History, Trekking, Ropeway", 500, "https://upload.wikimedia.org/wikipedia/commons/thumb/d/d7/Raigad_Fort_Maharashtra.jpg/1024px-Raigad_Fort_Maharashtra.jpg"),
+]
+SEED_HUB_COORDINATES = {"Sangli": (16.8524, 74.5815), "Ashta": (16.9480, 74.4090), "Islampur": (17.0470, 74.2640)}
+SEED_DESTINATION_COORDINATES = {
+    "Matheran": (18.9866, 73.2679), "Konkan": (16.9902, 73.3120), "Malshej Ghat": (19.3330, 73.7820), "Mumbai": (19.0760, 72.8777),
+    "Pune": (18.5204, 73.8567), "Lonavala & Khandala": (18.7546, 73.4062), "Mahabaleshwar": (17.9237, 73.6586), "Chhatrapati Sambhaji Nagar": (19.8762, 75.3433),
+    "Nashik": (19.9975, 73.7898), "Alibaug": (18.6414, 72.8722), "Shirdi": (19.7645, 74.4762), "Tadoba National Park": (20.2485, 79.3350),
+    "Ganpatipule": (17.1480, 73.2660), "Kolhapur": (16.7050, 74.2433), "Tarkarli": (16.0166, 73.4666), "Panchgani": (17.9250, 73.8000), "Raigad Fort": (18.2340, 73.4400),
+}
+SEED_HUB_DISTANCES = {
+    "Sangli": {"Matheran": 345, "Konkan": 185, "Malshej Ghat": 390, "Mumbai": 375, "Pune": 235, "Lonavala & Khandala": 295, "Mahabaleshwar": 185, "Chhatrapati Sambhaji Nagar": 470, "Nashik": 450, "Alibaug": 375, "Shirdi": 420, "Tadoba National Park": 890, "Ganpatipule": 215, "Kolhapur": 50, "Tarkarli": 215, "Panchgani": 175, "Raigad Fort": 305},
+    "Ashta": {"Matheran": 315, "Konkan": 155, "Malshej Ghat": 360, "Mumbai": 345, "Pune": 210, "Lonavala & Khandala": 270, "Mahabaleshwar": 155, "Chhatrapati Sambhaji Nagar": 445, "Nashik": 425, "Alibaug": 345, "Shirdi": 395, "Tadoba National Park": 860, "Ganpatipule": 165, "Kolhapur": 70, "Tarkarli": 185, "Panchgani": 145, "Raigad Fort": 275},
+    "Islampur": {"Matheran": 320, "Konkan": 150, "Malshej Ghat": 355, "Mumbai": 340, "Pune": 200, "Lonavala & Khandala": 265, "Mahabaleshwar": 145, "Chhatrapati Sambhaji Nagar": 435, "Nashik": 415, "Alibaug": 340, "Shirdi": 385, "Tadoba National Park": 850, "Ganpatipule": 155, "Kolhapur": 60, "Tarkarli": 180, "Panchgani": 135, "Raigad Fort": 270}
+}
+
 # --- Utility Function ---
 def populate_database_if_empty():
-    """Populates the destinations DB if empty."""
+    """Populates the destinations DB if empty. The check and the inserts share one write transaction, so concurrent processes seed only once."""
     conn = get_db_connection(); cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM destinations")
-    count = cursor.fetchone()[0]; conn.close()
-
-    if count == 0:
-        print("Destinations DB empty. Populating with sample data...")
-        # ADDED sample image URLs
-        sample_data = [
-            ("Matheran", "Maharashtra", "Hill Station, Viewpoints, Toy Train", 800, "https://upload.wikimedia.org/wikipedia/commons/thumb/d/d3/Matheran_Hills.jpg/1024px-Matheran_Hills.jpg"),
-            ("Konkan", "Maharashtra", "Beaches, Forts, Seafood (Ratnagiri)", 400, "https://upload.wikimedia.org/wikipedia/commons/thumb/a/a7/Ratnagiri_fort.jpg/1024px-Ratnagiri_fort.jpg"),
-            ("Malshej Ghat", "Maharashtra", "Waterfalls, Monsoon destination, Hiking", 580, "https://upload.wikimedia.org/wikipedia/commons/thumb/8/86/Malshej_Ghat_3.jpg/1024px-Malshej_Ghat_3.jpg"),
-            ("Mumbai", "Maharashtra", "Gateway of India, Marine Drive, Bollywood", 700, "https://upload.wikimedia.org/wikipedia/commons/thumb/7/7b/Mumbai_Skyline_at_Night.jpg/1024px-Mumbai_Skyline_at_Night.jpg"),
-            ("Pune", "Maharashtra", "Shaniwar Wada, Aga Khan Palace, Osho Ashram", 450, "https://upload.wikimedia.org/wikipedia/commons/thumb/8/8c/Shaniwar_wada_main_gate.jpg/1024px-Shaniwar_wada_main_gate.jpg"),
-            ("Lonavala & Khandala", "Maharashtra", "Hill stations, Caves, Chikki", 550, "https://upload.wikimedia.org/wikipedia/commons/thumb/c/c5/Bhaja_Caves_near_Lonavla_India.jpg/1024px-Bhaja_Caves_near_Lonavla_India.jpg"),
-            ("Mahabaleshwar", "Maharashtra", "Strawberry farms, Venna Lake, Viewpoints", 500, "https://upload.wikimedia.org/wikipedia/commons/thumb/a/af/Connaught_Peak_in_Mahabaleshwar.jpg/1024px-Connaught_Peak_in_Mahabaleshwar.jpg"),
-            ("Chhatrapati Sambhaji Nagar", "Maharashtra", "Ajanta & Ellora Caves, Bibi Ka Maqbara", 550, "https://upload.wikimedia.org/wikipedia/commons/thumb/d/d1/Bibi_Ka_Maqbara_Aurangabad.jpg/1024px-Bibi_Ka_Maqbara_Aurangabad.jpg"),
-            ("Nashik", "Maharashtra", "Vineyards, Sula Fest, Trimbakeshwar Temple", 480, "https://upload.wikimedia.org/wikipedia/commons/thumb/f/f0/Sula_Vineyards_Nashik_India.jpg/1024px-Sula_Vineyards_Nashik_India.jpg"),
-            ("Alibaug", "Maharashtra", "Beaches, Forts, Water sports", 420, "https://upload.wikimedia.org/wikipedia/commons/thumb/a/a9/Kolaba_Fort_at_Alibaug_20170313_150824.jpg/1024px-Kolaba_Fort_at_Alibaug_20170313_150824.jpg"),
-            ("Shirdi", "Maharashtra", "Sai Baba Temple, Pilgrimage site", 550, "https://upload.wikimedia.org/wikipedia/commons/thumb/1/13/Shirdi_Sai_Temple.jpg/1024px-Shirdi_Sai_Temple.jpg"),
-            ("Tadoba National Park", "Maharashtra", "Tiger Safari, Wildlife, Jungle", 800, "https://upload.wikimedia.org/wikipedia/commons/thumb/1/1a/Tadoba_Tiger.jpg/1024px-Tadoba_Tiger.jpg"),
-            ("Ganpatipule", "Maharashtra", "Swayambhu Ganesh Temple, Pristine Beach", 480, "https://upload.wikimedia.org/wikipedia/commons/thumb/3/3d/Ganpatipule_temple_and_sea_shore.jpg/1024px-Ganpatipule_temple_and_sea_shore.jpg"),
-            ("Kolhapur", "Maharashtra", "Mahalakshmi Temple, Panhala Fort, Cuisine", 300, "https://upload.wikimedia.org/wikipedia/commons/thumb/9/90/Mahalaxmi_temple_Kolhapur.jpg/1024px-Mahalaxmi_temple_Kolhapur.jpg"),
-            ("Tarkarli", "Maharashtra", "Scuba Diving, Snorkeling, Malvan coast", 650, "https://upload.wikimedia.org/wikipedia/commons/thumb/b/be/Tarkarli_Beach_2.jpg/1024px-Tarkarli_Beach_2.jpg"),
-            ("Panchgani", "Maharashtra", "Table Land, Paragliding, Mapro Garden", 490, "https://upload.wikimedia.org/wikipedia/commons/thumb/a/a9/Table_Land_Panchgani_2.jpg/1024px-Table_Land_Panchgani_2.jpg"),
-            ("Raigad Fort", "Maharashtra", "Maratha History, Trekking, Ropeway", 500, "https://upload.wikimedia.org/wikipedia/commons/thumb/d/d7/Raigad_Fort_Maharashtra.jpg/1024px-Raigad_Fort_Maharashtra.jpg"),
-        ]
-        for item in sample_data:
-            add_destination(*item) # Call with 5 arguments
-        print("Sample destinations populated.")
-    else:
-         print("Destinations DB not empty.")
\ No newline at end of file
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT COUNT(*) FROM destinations")
+        count = cursor.fetchone()[0]
+        if count == 0:
+            print("Destinations DB empty. Populating with sample data...")
+            cursor.executemany("INSERT INTO destinations (name, region, highlights, cost, image_url) VALUES (?, ?, ?, ?, ?)", SAMPLE_DESTINATIONS)
+            seed_hub_distances(cursor)
+            _commit_change(conn, ("catalog", "distances"))
+            print("Sample destinations populated.")
+        else: conn.rollback(); print("Destinations DB not empty.")
+    finally: conn.close()
+
+# --- Instrumentation ---
+# Every public function above records its latency in metrics (tripwala_function_seconds)
+metrics.instrument_module(globals(), __name__)
+
+# --- Command Line ---
+# python db_utils.py backfill-rollups   -- rebuild the analytics rollups from the raw bookings
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Trip Wala database maintenance")
+    parser.add_argument("command", choices=["backfill-rollups"])
+    args = parser.parse_args()
+    initialize_database()
+    if args.command == "backfill-rollups": print(f"Rebuilt booking rollups from {rebuild_rollups()} bookings.")
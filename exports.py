@@ -0,0 +1,106 @@
+import csv
+import io
+
+import db_utils
+
+# --- Settings ---
+PARQUET_ROW_GROUP_ROWS = 50_000  # Rows buffered per Parquet row group (chunks from db_utils are combined up to this)
+FORMATS = {"csv": "text/csv; charset=utf-8", "parquet": "application/vnd.apache.parquet"}
+
+# Column types for Parquet; CSV just writes the values
+COLUMN_TYPES = {
+    "id": "int64", "num_people": "int64", "stay_days": "int64", "cost": "int64",
+    "total_budget": "float64", "latitude": "float64", "longitude": "float64",
+    "booking_timestamp": "timestamp",
+}
+
+# --- Datasets ---
+def _datasets():
+    return {
+        "bookings": (db_utils.BOOKING_EXPORT_COLUMNS, db_utils.iter_bookings),
+        "destinations": (db_utils.DESTINATION_EXPORT_COLUMNS, db_utils.iter_destinations),
+    }
+
+def export_chunks(dataset, **filters):
+    """(columns, chunk generator) for a dataset; filters go to the db_utils iterator (bookings: username, start, end)."""
+    datasets = _datasets()
+    if dataset not in datasets: raise ValueError(f"dataset must be one of {', '.join(datasets)}")
+    columns, iterate = datasets[dataset]
+    return columns, iterate(**filters)
+
+# --- CSV ---
+def csv_stream(columns, chunks):
+    """Yields UTF-8 CSV bytes: the header, then one block per chunk of rows."""
+    buf = io.StringIO(); writer = csv.writer(buf)
+    writer.writerow(columns)
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buf.getvalue().encode(); buf.seek(0); buf.truncate(0)
+    if buf.tell(): yield buf.getvalue().encode()  # Header only (no rows)
+
+# --- Parquet ---
+class _StreamSink:
+    """Write-only file for pyarrow that hands bytes on instead of keeping them; tell() stays the absolute offset."""
+
+    def __init__(self):
+        self._chunks = []; self._position = 0; self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data)); self._position += len(data)
+        return len(data)
+
+    def tell(self): return self._position
+    def flush(self): pass
+    def close(self): self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks); self._chunks.clear()
+        return data
+
+def _arrow_schema(columns):
+    import pyarrow as pa
+    types = {"int64": pa.int64(), "float64": pa.float64(), "timestamp": pa.timestamp("s")}
+    return pa.schema([(column, types.get(COLUMN_TYPES.get(column), pa.string())) for column in columns])
+
+def parquet_stream(columns, chunks, row_group_rows=PARQUET_ROW_GROUP_ROWS):
+    """Yields a Parquet file as it is written, one row group at a time."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = _arrow_schema(columns); sink = _StreamSink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema, compression="zstd")
+
+    def row_group(rows):
+        values = list(zip(*rows))
+        arrays = [pa.array(values[i], pa.string()).cast(field.type) if field.type == pa.timestamp("s") else pa.array(values[i], field.type)
+                  for i, field in enumerate(schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    try:
+        pending = []
+        for chunk in chunks:
+            pending.extend(chunk)
+            if len(pending) >= row_group_rows:
+                row_group(pending); pending = []
+                yield sink.drain()
+        if pending: row_group(pending)
+    finally: writer.close()
+    yield sink.drain()  # Remaining data and the footer
+
+# --- Entry Points ---
+def stream_export(dataset, fmt, **filters):
+    """(byte generator, media_type, file name) for streaming a dataset as CSV or Parquet."""
+    if fmt not in FORMATS: raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    columns, chunks = export_chunks(dataset, **filters)
+    stream = csv_stream(columns, chunks) if fmt == "csv" else parquet_stream(columns, chunks)
+    return _closing(stream, chunks), FORMATS[fmt], f"{dataset}.{fmt}"
+
+def _closing(stream, chunks):
+    """Closes the row iterator (returning its pooled connection) as soon as the stream ends or is abandoned."""
+    try: yield from stream
+    finally: stream.close(); chunks.close()
+
+def write_export(file, dataset, fmt, **filters):
+    """Streams an export into a binary file object. Returns bytes written."""
+    stream, _, _ = stream_export(dataset, fmt, **filters); written = 0
+    for block in stream: file.write(block); written += len(block)
+    return written
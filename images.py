@@ -0,0 +1,175 @@
+import hashlib
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+# --- Settings ---
+THUMBNAIL_DIR = Path(".thumbnails")       # Size-bounded on-disk thumbnail cache
+UPLOAD_DIR = Path("uploads")              # Admin-uploaded source images
+# TRIPWALA_IMAGES_OFFLINE=1 never touches the network: images come only from uploads and the fixture directory
+IMAGE_FIXTURE_DIR = Path(os.environ.get("TRIPWALA_IMAGE_FIXTURES", "image_fixtures"))  # Local copies of remote images, matched by file name
+OFFLINE = os.environ.get("TRIPWALA_IMAGES_OFFLINE", "0") not in ("", "0")
+MAX_CACHE_BYTES = 64 * 1024 * 1024        # Least recently used thumbnails are evicted past this
+MAX_SOURCE_BYTES = 20 * 1024 * 1024       # Refuse to download anything bigger
+FETCH_TIMEOUT = 5.0                       # Seconds per remote fetch
+FAILED_FETCH_RETRY = 300.0                # Seconds before retrying a source that failed
+THUMBNAIL_SIZES = {"card": (480, 320), "small": (240, 160)}
+THUMBNAIL_QUALITY = 80
+USER_AGENT = "TripWala/1.0 (thumbnail cache)"
+
+_lock = threading.Lock()
+_cache_bytes = None   # Total size of THUMBNAIL_DIR, computed on first use
+_failed_sources = {}  # source -> time of last failed load
+_placeholders = {}    # size -> (bytes, media_type)
+
+# --- Output Format ---
+def _output_format():
+    """WebP when this Pillow build can write it, otherwise JPEG."""
+    from PIL import features
+    return ("WEBP", "image/webp", "webp") if features.check("webp") else ("JPEG", "image/jpeg", "jpg")
+
+def _render(image, size):
+    from PIL import Image, ImageOps
+    image = ImageOps.exif_transpose(image).convert("RGB")
+    thumb = ImageOps.fit(image, size, method=Image.Resampling.LANCZOS)
+    fmt, media_type, _ = _output_format()
+    buf = BytesIO(); thumb.save(buf, format=fmt, quality=THUMBNAIL_QUALITY, optimize=True)
+    return buf.getvalue(), media_type
+
+def placeholder_thumbnail(size="card"):
+    """A plain grey thumbnail used when a destination has no usable image. Rendered locally, never fetched."""
+    if size not in _placeholders:
+        from PIL import Image, ImageDraw
+        width, height = THUMBNAIL_SIZES[size]
+        image = Image.new("RGB", (width, height), (222, 226, 230))
+        ImageDraw.Draw(image).text((width // 2, height // 2), "Image not available", fill=(108, 117, 125), anchor="mm")
+        _placeholders[size] = _render(image, (width, height))
+    return _placeholders[size]
+
+# --- Source Images ---
+def _local_source(image_url):
+    """Maps an image_url to a local file under UPLOAD_DIR or IMAGE_FIXTURE_DIR, or None."""
+    if image_url.startswith(("http://", "https://")):
+        fixture = IMAGE_FIXTURE_DIR / Path(urllib.request.url2pathname(image_url.rsplit("/", 1)[-1])).name
+        return fixture if fixture.is_file() else None
+    path = Path(urllib.request.url2pathname(image_url[len("file://"):])) if image_url.startswith("file://") else Path(image_url)
+    path = path.resolve()
+    # Only serve files from our own image directories, never arbitrary paths
+    for root in (UPLOAD_DIR, IMAGE_FIXTURE_DIR):
+        if path.is_file() and path.is_relative_to(root.resolve()): return path
+    return None
+
+def _load_source(image_url):
+    """Raw bytes of a destination image from disk or (unless OFFLINE) the network, or None."""
+    local = _local_source(image_url)
+    if local is not None: return local.read_bytes()
+    if OFFLINE or not image_url.startswith(("http://", "https://")): return None
+    failed_at = _failed_sources.get(image_url)
+    if failed_at is not None and time.monotonic() - failed_at < FAILED_FETCH_RETRY: return None
+    try:
+        request = urllib.request.Request(image_url, headers={"User-Agent": USER_AGENT})
+        with urllib.request.urlopen(request, timeout=FETCH_TIMEOUT) as response:
+            data = response.read(MAX_SOURCE_BYTES + 1)
+        if len(data) > MAX_SOURCE_BYTES: raise ValueError("image too large")
+        return data
+    except Exception as e:
+        print(f"Image fetch failed for {image_url}: {e}"); _failed_sources[image_url] = time.monotonic()
+        return None
+
+def save_upload(data, filename):
+    """Stores an uploaded image under UPLOAD_DIR (content-addressed) and returns the path to use as image_url."""
+    from PIL import Image
+    Image.open(BytesIO(data)).verify()  # Reject anything Pillow can't read before it's stored
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    suffix = Path(filename).suffix.lower() or ".img"
+    path = UPLOAD_DIR / f"{hashlib.sha1(data).hexdigest()}{suffix}"
+    if not path.exists(): path.write_bytes(data)
+    return path.as_posix()
+
+# --- Thumbnail Cache ---
+def thumbnail_key(destination_id, image_url, size="card"):
+    """Cache key: changes whenever the destination's image_url changes, so an update invalidates the old entry."""
+    url_hash = hashlib.sha1((image_url or "").encode()).hexdigest()[:16]
+    return f"{destination_id}-{url_hash}-{size}"
+
+def _cache_size():
+    global _cache_bytes
+    if _cache_bytes is None:
+        _cache_bytes = sum(p.stat().st_size for p in THUMBNAIL_DIR.glob("*") if p.is_file()) if THUMBNAIL_DIR.exists() else 0
+    return _cache_bytes
+
+def _remove(path):
+    """Deletes one cache file and updates the size tally. Caller holds _lock."""
+    global _cache_bytes
+    try: size = path.stat().st_size; path.unlink()
+    except FileNotFoundError: return
+    _cache_bytes = _cache_size() - size
+
+def _evict(keep):
+    """Deletes least recently used thumbnails (oldest mtime) until the cache fits MAX_CACHE_BYTES. Caller holds _lock."""
+    if _cache_size() <= MAX_CACHE_BYTES: return
+    entries = sorted((p.stat().st_mtime, p) for p in THUMBNAIL_DIR.glob("*") if p.is_file() and p != keep)
+    for _, path in entries:
+        if _cache_size() <= MAX_CACHE_BYTES: break
+        _remove(path)
+
+def invalidate(destination_id):
+    """Drops every cached thumbnail for a destination."""
+    with _lock:
+        for path in THUMBNAIL_DIR.glob(f"{destination_id}-*"): _remove(path)
+
+def invalidate_many(destination_ids):
+    """invalidate() for a batch of destinations (e.g. a bulk import) with a single scan of the cache directory."""
+    ids = {str(id) for id in destination_ids}
+    if not ids or not THUMBNAIL_DIR.exists(): return
+    with _lock:
+        for path in THUMBNAIL_DIR.glob("*-*"):
+            if path.name.split("-", 1)[0] in ids: _remove(path)
+
+def get_thumbnail(destination_id, image_url, size="card"):
+    """
+    Returns (bytes, media_type, etag) for a destination's thumbnail, building and caching it on
+    first use. Returns None when there is no usable image (callers fall back to placeholder_thumbnail).
+    """
+    global _cache_bytes
+    if size not in THUMBNAIL_SIZES: raise ValueError(f"Unknown thumbnail size: {size}")
+    if not image_url or not isinstance(image_url, str): return None
+    key = thumbnail_key(destination_id, image_url, size)
+    _, media_type, ext = _output_format()
+    path = THUMBNAIL_DIR / f"{key}.{ext}"
+    try:
+        data = path.read_bytes(); os.utime(path)  # Touch: mtime doubles as the LRU timestamp
+        return data, media_type, key
+    except FileNotFoundError: pass
+    source = _load_source(image_url)
+    if source is None: return None
+    try:
+        from PIL import Image
+        data, media_type = _render(Image.open(BytesIO(source)), THUMBNAIL_SIZES[size])
+    except Exception as e: print(f"Thumbnail render failed for {image_url}: {e}"); return None
+    with _lock:
+        THUMBNAIL_DIR.mkdir(parents=True, exist_ok=True); _cache_size()  # Tally existing files before adding this one
+        for stale in THUMBNAIL_DIR.glob(f"{destination_id}-*-{size}.*"):  # Entries for an old image_url
+            if stale != path: _remove(stale)
+        tmp = path.with_suffix(f".tmp{threading.get_ident()}")
+        tmp.write_bytes(data); os.replace(tmp, path)  # Atomic, so readers never see a half-written file
+        _cache_bytes += len(data)
+        _evict(keep=path)
+    return data, media_type, key
+
+def get_thumbnails(destinations, size="card", max_workers=8):
+    """Thumbnails for many {'id', 'image_url'} dicts at once, fetched concurrently. Returns {id: bytes or None}."""
+    def load(dest):
+        thumbnail = get_thumbnail(dest["id"], dest.get("image_url"), size)
+        return dest["id"], thumbnail[0] if thumbnail else None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(executor.map(load, destinations))
+
+def get_cache_stats():
+    with _lock:
+        files = len(list(THUMBNAIL_DIR.glob("*"))) if THUMBNAIL_DIR.exists() else 0
+        return {"files": files, "bytes": _cache_size(), "max_bytes": MAX_CACHE_BYTES, "failed_sources": len(_failed_sources)}
@@ -0,0 +1,127 @@
+import time
+
+import numpy as np
+import pricing
+
+# --- Settings ---
+EXACT_MAX_STOPS = 13                # Up to this many stops the order is provably cheapest (Held-Karp DP)
+MAX_STOPS = 60                      # Largest circuit accepted; above EXACT_MAX_STOPS a heuristic picks the order
+HEURISTIC_TIME_BUDGET_MS = 200      # Wall-clock budget for 2-opt improvement on large circuits
+
+# --- Distances ---
+def leg_distances(hub, destination_ids, matrix=None):
+    """
+    One-way km for a circuit: (hub_km, km) where hub_km[i] is hub -> stop i from the
+    distances table and km[i, j] is stop i -> stop j, estimated from coordinates like
+    compute_missing_distances() (haversine x ROAD_FACTOR). A pair without coordinates,
+    or one whose estimate is longer than going back through the hub, is routed via the hub.
+    """
+    matrix = matrix or pricing.get_distance_matrix(); h = matrix.hub_index(hub)
+    positions = matrix.destination_positions(destination_ids)
+    if (positions < 0).any(): raise ValueError(f"Unknown destination id(s): {', '.join(str(d) for d, p in zip(destination_ids, positions) if p < 0)}")
+    hub_km = matrix.km[h, positions]
+    if np.isnan(hub_km).any(): raise ValueError(f"No distance from {hub} to: {', '.join(matrix.destination_names[p] for p in positions[np.isnan(hub_km)])}")
+    lat, lon = matrix.destination_coords[positions, 0], matrix.destination_coords[positions, 1]
+    km = np.round(pricing.haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :]) * pricing.ROAD_FACTOR)
+    km = np.fmin(km, hub_km[:, None] + hub_km[None, :])  # fmin: NaN (no coordinates) falls back to the via-hub route
+    np.fill_diagonal(km, 0)
+    return hub_km.astype(float), km
+
+def circuit_km(order, hub_km, km):
+    """Length of hub -> order... -> hub."""
+    if not order: return 0.0
+    return float(hub_km[order[0]] + sum(km[a, b] for a, b in zip(order, order[1:])) + hub_km[order[-1]])
+
+# --- Solvers ---
+def solve_exact(hub_km, km):
+    """
+    Shortest circuit by Held-Karp: best[mask, j] memoizes the shortest hub -> ... -> j path
+    through the stops in mask. Filled one subset size at a time, vectorized over all masks
+    of that size. O(2^n * n^2); meant for n <= EXACT_MAX_STOPS.
+    """
+    n = len(hub_km); full = 1 << n
+    best = np.full((full, n), np.inf); parent = np.full((full, n), -1, dtype=np.int16)
+    best[1 << np.arange(n), np.arange(n)] = hub_km
+    masks = np.arange(full); sizes = np.bitwise_count(masks)
+    for size in range(2, n + 1):
+        layer = masks[sizes == size]
+        for j in range(n):
+            with_j = layer[(layer >> j) & 1 == 1]; candidates = best[with_j ^ (1 << j)] + km[:, j]
+            previous = np.argmin(candidates, axis=1)
+            best[with_j, j] = candidates[np.arange(len(with_j)), previous]; parent[with_j, j] = previous
+    totals = best[full - 1] + hub_km; j = int(np.argmin(totals)); mask = full - 1; order = []
+    while j >= 0: order.append(j); mask, j = mask ^ (1 << j), int(parent[mask, j])
+    return order[::-1]
+
+def _nearest_neighbour(first, km):
+    n = len(km); unvisited = np.ones(n, dtype=bool); order = [first]; unvisited[first] = False
+    for _ in range(n - 1):
+        current = int(np.argmin(np.where(unvisited, km[order[-1]], np.inf))); order.append(current); unvisited[current] = False
+    return order
+
+def _two_opt(tour, dist, deadline):
+    """Improves a closed tour in place with 2-opt moves until none helps. Returns False if the deadline cut it short."""
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(tour) - 2):
+            if time.perf_counter() > deadline: return False
+            # Reversing tour[i..j] swaps edges (a, b) + (c, e) for (a, c) + (b, e); check every j at once
+            a, b = tour[i - 1], tour[i]; c, e = tour[i + 1:-1], tour[i + 2:]
+            gain = dist[a, c] + dist[b, e] - dist[a, b] - dist[c, e]; k = int(np.argmin(gain))
+            if gain[k] < -1e-9: j = i + 1 + k; tour[i:j + 1] = tour[i:j + 1][::-1].copy(); improved = True
+    return True
+
+def solve_heuristic(hub_km, km, time_budget_ms=HEURISTIC_TIME_BUDGET_MS):
+    """
+    Nearest-neighbour circuits improved by 2-opt, starting from each stop in turn (closest to
+    the hub first) while the time budget lasts; the shortest wins. Returns (order, finished),
+    finished being False if the budget ran out before every start was tried.
+    """
+    n = len(hub_km); deadline = time.perf_counter() + time_budget_ms / 1000
+    # The hub is node n, so a circuit is a closed tour n -> order... -> n
+    dist = np.zeros((n + 1, n + 1)); dist[:n, :n] = km; dist[n, :n] = dist[:n, n] = hub_km
+    best = None; best_km = np.inf
+    for first in np.argsort(hub_km, kind="stable"):
+        tour = np.array([n] + _nearest_neighbour(int(first), km) + [n]); finished = _two_opt(tour, dist, deadline)
+        length = dist[tour[:-1], tour[1:]].sum()
+        if length < best_km: best = tour[1:-1].tolist(); best_km = length
+        if not finished or time.perf_counter() > deadline: return best, False
+    return best, True
+
+# --- Itinerary ---
+def plan_itinerary(hub, destination_ids, days=2, num_people=1, transport_mode="Car", time_budget_ms=HEURISTIC_TIME_BUDGET_MS):
+    """
+    Cheapest order to visit destinations on one circuit from a hub and back. days is the stay
+    at every stop or a list with one entry per destination. Stay costs don't depend on the
+    order, so the cheapest circuit is the shortest one. Returns a JSON-ready dict with
+    the stops in visiting order and a cost breakdown matching quote_trip() for one stop.
+    """
+    destination_ids = [int(d) for d in destination_ids]
+    if not destination_ids: raise ValueError("Pick at least one destination")
+    if len(destination_ids) > MAX_STOPS: raise ValueError(f"At most {MAX_STOPS} stops per itinerary")
+    if len(set(destination_ids)) != len(destination_ids): raise ValueError("Each destination can only be visited once")
+    days = [days] * len(destination_ids) if isinstance(days, int) else list(days)
+    if len(days) != len(destination_ids): raise ValueError("days needs one entry per destination")
+    if num_people < 1 or any(d < 1 for d in days): raise ValueError("num_people and days must be >= 1")
+    if transport_mode not in pricing.TRANSPORT_RATES_PER_KM: raise ValueError(f"Unknown transport mode: {transport_mode}")
+
+    matrix = pricing.get_distance_matrix(); hub_km, km = leg_distances(hub, destination_ids, matrix)
+    started = time.perf_counter()
+    if len(destination_ids) <= EXACT_MAX_STOPS: order = solve_exact(hub_km, km); solver = "exact"; optimal = True
+    else: order, _ = solve_heuristic(hub_km, km, time_budget_ms); solver = "heuristic"; optimal = False
+    solve_ms = (time.perf_counter() - started) * 1000
+
+    positions = matrix.destination_positions(destination_ids); costs = np.nan_to_num(matrix.costs[positions])  # NULL cost -> 0, as in get_quote_matrix
+    rate = pricing.TRANSPORT_RATES_PER_KM[transport_mode]; stops = []; previous = None
+    for i in order:
+        leg_km = float(hub_km[i] if previous is None else km[previous, i]); previous = i
+        stops.append({"id": destination_ids[i], "name": matrix.destination_names[positions[i]], "days": days[i], "leg_km": leg_km,
+                      "base_per_person_per_day_cost": float(costs[i]), "stay_cost": float(costs[i]) * num_people * days[i]})
+    return_km = float(hub_km[order[-1]]); total_km = sum(s["leg_km"] for s in stops) + return_km
+    total_base_cost = sum(s["stay_cost"] for s in stops)
+    total_transport_cost = (total_km * rate) if transport_mode in pricing.PER_VEHICLE_MODES else (total_km * rate * num_people)
+    return {"start_city": hub, "num_people": num_people, "transport_mode": transport_mode, "stops": stops, "return_km": return_km,
+            "total_days": sum(days), "total_distance_km": total_km, "input_order_km": circuit_km(list(range(len(destination_ids))), hub_km, km),
+            "total_base_cost": total_base_cost, "transport_rate": rate, "total_transport_cost": total_transport_cost,
+            "total_budget": total_base_cost + total_transport_cost, "solver": solver, "optimal": optimal, "solve_ms": round(solve_ms, 3)}
@@ -0,0 +1,217 @@
+import bisect
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+
+# --- Settings ---
+# TRIPWALA_METRICS=0 turns everything off: wrappers then cost one global lookup and a branch per call.
+ENABLED = os.environ.get("TRIPWALA_METRICS", "1") != "0"
+SLOW_QUERY_SECONDS = float(os.environ.get("TRIPWALA_SLOW_QUERY_MS", "100")) / 1000  # Statements at least this slow go to the slow-query log
+SLOW_QUERY_LOG_SIZE = 200                                   # Most recent slow statements kept in memory
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Seconds
+MAX_SQL_LABEL = 160                                         # Statement labels are truncated to this many characters
+
+slow_query_logger = logging.getLogger("tripwala.slow_sql")
+
+_lock = threading.Lock()
+_histograms = {}   # (name, labels) -> Histogram
+_counters = {}     # (name, labels) -> float
+_help = {}         # name -> help text
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_local = threading.local()  # .events: list while a capture (e.g. one Streamlit rerun) is active on this thread
+
+def set_enabled(enabled):
+    global ENABLED
+    ENABLED = bool(enabled)
+
+# --- Metric Types ---
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus style."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets; self.counts = [0] * (len(buckets) + 1); self.sum = 0.0; self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1; self.sum += value; self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th quantile (the last finite bucket's bound stands in for +Inf)."""
+        if self.count == 0: return None
+        target = q * self.count; running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            if running >= target: return bound
+        return self.buckets[-1]
+
+def describe(name, help_text):
+    _help[name] = help_text
+
+def observe(name, seconds, **labels):
+    """Records one duration in the named histogram."""
+    _observe((name, tuple(sorted(labels.items()))), labels, seconds)
+
+def _observe(key, labels, seconds):
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None: histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+    events = getattr(_local, "events", None)
+    if events is not None: events.append((key[0], labels, seconds))
+
+def inc(name, amount=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock: _counters[key] = _counters.get(key, 0) + amount
+
+describe("tripwala_function_seconds", "Time spent in instrumented Python functions.")
+describe("tripwala_function_errors_total", "Instrumented function calls that raised.")
+describe("tripwala_sql_seconds", "Time to execute a SQL statement (to its first result row).")
+describe("tripwala_sql_slow_total", "SQL statements slower than the slow-query threshold.")
+describe("tripwala_http_request_seconds", "API request latency by route and status.")
+
+# --- Function Timing ---
+def timed(name=None):
+    """Decorator recording each call's duration in tripwala_function_seconds{function=name}."""
+    def decorate(fn):
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+        labels = {"function": label}; key = ("tripwala_function_seconds", (("function", label),))  # Built once, not per call
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED: return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try: return fn(*args, **kwargs)
+            except Exception: inc("tripwala_function_errors_total", function=label); raise
+            finally: _observe(key, labels, time.perf_counter() - started)
+        wrapper.__wrapped_by_metrics__ = True
+        return wrapper
+    return decorate
+
+def instrument_module(namespace, module_name, skip=()):
+    """Wraps every public function defined in a module (pass its globals()) with timed()."""
+    for attr, value in list(namespace.items()):
+        if attr.startswith("_") or attr in skip or not callable(value) or isinstance(value, type): continue
+        if getattr(value, "__module__", None) != module_name or getattr(value, "__wrapped_by_metrics__", False): continue
+        namespace[attr] = timed(f"{module_name}.{attr}")(value)
+
+# --- SQL Timing ---
+@functools.lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """One label per statement shape: whitespace collapsed, placeholder lists and numbers folded, truncated."""
+    sql = re.sub(r"\s+", " ", sql).strip()
+    sql = re.sub(r"\?(?:\s*,\s*\?)+", "?, ...", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "N", sql)
+    return sql if len(sql) <= MAX_SQL_LABEL else sql[:MAX_SQL_LABEL - 3] + "..."
+
+def _value_shape(value):
+    return "None" if value is None else type(value).__name__
+
+def params_shape(params, many=False):
+    """Types of the bound parameters, never their values, e.g. '(str, int)' or '128 x (str, int)'."""
+    if many:
+        if not isinstance(params, (list, tuple)): return "iterator"
+        return f"{len(params)} x {params_shape(params[0]) if params else '()'}"
+    if isinstance(params, dict): return "{" + ", ".join(f"{k}: {_value_shape(v)}" for k, v in params.items()) + "}"
+    return "(" + ", ".join(_value_shape(v) for v in params) + ")"
+
+def time_sql(run, sql, params, many=False):
+    """Runs run() (which executes sql), recording its duration and logging it if slow."""
+    started = time.perf_counter()
+    try: return run()
+    finally:
+        elapsed = time.perf_counter() - started; statement = normalize_sql(sql)
+        observe("tripwala_sql_seconds", elapsed, statement=statement)
+        if elapsed >= SLOW_QUERY_SECONDS:
+            entry = {"at": time.time(), "duration_ms": round(elapsed * 1000, 3), "sql": re.sub(r"\s+", " ", sql).strip(),
+                     "params": params_shape(params, many), "thread": threading.current_thread().name}
+            _slow_queries.append(entry); inc("tripwala_sql_slow_total", statement=statement)
+            slow_query_logger.warning("Slow SQL (%.1f ms, params %s): %s", entry["duration_ms"], entry["params"], entry["sql"])
+
+class TimedCursor:
+    """Proxy for a DB-API cursor that times execute/executemany/executescript."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, parameters=()):
+        time_sql(lambda: self._cursor.execute(sql, parameters), sql, parameters); return self
+
+    def executemany(self, sql, seq_of_parameters):
+        if not isinstance(seq_of_parameters, (list, tuple)): seq_of_parameters = list(seq_of_parameters)
+        time_sql(lambda: self._cursor.executemany(sql, seq_of_parameters), sql, seq_of_parameters, many=True); return self
+
+    def executescript(self, script):
+        time_sql(lambda: self._cursor.executescript(script), script, ()); return self
+
+    def __iter__(self): return iter(self._cursor)
+    def __getattr__(self, attr): return getattr(self._cursor, attr)
+
+def get_slow_queries():
+    """Most recent slow statements, newest first."""
+    return list(reversed(_slow_queries))
+
+# --- Per-Thread Capture ---
+def start_capture():
+    """Starts recording every observation made on this thread (used for the admin timing panel)."""
+    _local.events = []
+
+def stop_capture():
+    """Stops recording and returns [(metric, labels, seconds)] observed since start_capture()."""
+    events = getattr(_local, "events", None) or []
+    _local.events = None
+    return events
+
+# --- Export ---
+def snapshot():
+    """{metric: [{labels, count, sum, p50, p95}]} for histograms plus {metric: [{labels, value}]} for counters."""
+    with _lock:
+        histograms = [(name, dict(labels), h.count, h.sum, h.quantile(0.5), h.quantile(0.95)) for (name, labels), h in _histograms.items()]
+        counters = [(name, dict(labels), value) for (name, labels), value in _counters.items()]
+    result = {}
+    for name, labels, count, total, p50, p95 in histograms:
+        result.setdefault(name, []).append({"labels": labels, "count": count, "sum": total, "p50": p50, "p95": p95})
+    for name, labels, value in counters: result.setdefault(name, []).append({"labels": labels, "value": value})
+    return result
+
+def reset():
+    with _lock: _histograms.clear(); _counters.clear()
+    _slow_queries.clear()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}" if items else ""
+
+def render_prometheus(gauges=None, counters=None):
+    """
+    All metrics in the Prometheus text exposition format. gauges is an optional
+    {name: (help, value)} or {name: (help, [(labels dict, value), ...])} of point-in-time values;
+    counters takes the same shape for running totals kept elsewhere (names ending in _total).
+    """
+    lines = []
+    with _lock:
+        histograms = sorted(((name, labels, list(h.counts), h.sum, h.count, h.buckets) for (name, labels), h in _histograms.items()), key=lambda x: (x[0], x[1]))
+        recorded = sorted(_counters.items())
+    seen = set()
+    for name, labels, counts, total, count, buckets in histograms:
+        if name not in seen:
+            seen.add(name); lines += [f"# HELP {name} {_help.get(name, name)}", f"# TYPE {name} histogram"]
+        running = 0
+        for bound, bucket_count in zip(buckets, counts):
+            running += bucket_count; lines.append(f"{name}_bucket{_labels(labels, ('le', repr(bound)))} {running}")
+        lines.append(f"{name}_bucket{_labels(labels, ('le', '+Inf'))} {count}")
+        lines.append(f"{name}_sum{_labels(labels)} {total!r}"); lines.append(f"{name}_count{_labels(labels)} {count}")
+    for (name, labels), value in recorded:
+        if name not in seen:
+            seen.add(name); lines += [f"# HELP {name} {_help.get(name, name)}", f"# TYPE {name} counter"]
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for kind, values in (("counter", counters), ("gauge", gauges)):
+        for name, (help_text, value) in sorted((values or {}).items()):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            for labels, v in (value if isinstance(value, list) else [({}, value)]):
+                lines.append(f"{name}{_labels(sorted(labels.items()))} {v}")
+    return "\n".join(lines) + "\n"
@@ -1,73 +1,90 @@
 import streamlit as st
-import pandas as pd
 import db_utils
+import images
+import metrics
+import payments
 import streamlit_authenticator as stauth
 import yaml
 from yaml.loader import SafeLoader
 import datetime
-import qrcode
-from io import BytesIO
 import time
 
 # --- Page Configuration ---
 st.set_page_config(page_title="Trip Wala", page_icon="🗺️", layout="wide")
 
 # --- Constants ---
-TRANSPORT_RATES_PER_KM = { "Bus": 2.5, "Car": 14.0 }
-DISTANCES_FROM_HUBS = {
-    "Sangli": {"Matheran": 345, "Konkan": 185, "Malshej Ghat": 390, "Mumbai": 375, "Pune": 235, "Lonavala & Khandala": 295, "Mahabaleshwar": 185, "Chhatrapati Sambhaji Nagar": 470, "Nashik": 450, "Alibaug": 375, "Shirdi": 420, "Tadoba National Park": 890, "Ganpatipule": 215, "Kolhapur": 50, "Tarkarli": 215, "Panchgani": 175, "Raigad Fort": 305},
-    "Ashta": {"Matheran": 315, "Konkan": 155, "Malshej Ghat": 360, "Mumbai": 345, "Pune": 210, "Lonavala & Khandala": 270, "Mahabaleshwar": 155, "Chhatrapati Sambhaji Nagar": 445, "Nashik": 425, "Alibaug": 345, "Shirdi": 395, "Tadoba National Park": 860, "Ganpatipule": 165, "Kolhapur": 70, "Tarkarli": 185, "Panchgani": 145, "Raigad Fort": 275},
-    "Islampur": {"Matheran": 320, "Konkan": 150, "Malshej Ghat": 355, "Mumbai": 340, "Pune": 200, "Lonavala & Khandala": 265, "Mahabaleshwar": 145, "Chhatrapati Sambhaji Nagar": 435, "Nashik": 415, "Alibaug": 340, "Shirdi": 385, "Tadoba National Park": 850, "Ganpatipule": 155, "Kolhapur": 60, "Tarkarli": 180, "Panchgani": 135, "Raigad Fort": 270}
-}
 GPAY_LOGO_URL = "https://upload.wikimedia.org/wikipedia/commons/thumb/f/f2/Google_Pay_Logo.svg/1200px-Google_Pay_Logo.svg.png"
 PHONEPE_LOGO_URL = "https://upload.wikimedia.org/wikipedia/commons/thumb/7/71/PhonePe_Logo.svg/1200px-PhonePe_Logo.svg.png"
-PLACEHOLDER_IMAGE_URL = "https://upload.wikimedia.org/wikipedia/commons/thumb/3/3f/Placeholder_view_vector.svg/681px-Placeholder_view_vector.svg.png"
+BOOKINGS_PAGE_SIZE = 20
+GRID_PAGE_SIZE = 12  # Destination cards fetched and rendered per grid page
 
 # --- Database Initialization ---
-# !! Delete old tripwala.db file before running !!
-db_utils.create_tables()
-db_utils.create_bookings_table()
-db_utils.populate_database_if_empty()
+# Tables, migrations and seeding run once per process; on later reruns this is a no-op
+db_utils.initialize_database()
+
+# Every db_utils call and SQL statement made during this rerun is recorded, but only while an admin has the timing panel open
+if st.session_state.get("show_rerun_timings"): metrics.start_capture()
+else: metrics.stop_capture()  # Also ends a capture an interrupted rerun (st.rerun/st.stop) left on this thread
+rerun_started = time.perf_counter()
 
 # --- Functions ---
-@st.cache_data
-def load_data():
+# Keyed on the catalog generation stored in the DB, so an edit made here or through the API
+# invalidates exactly these entries -- no st.cache_data.clear() after writes.
+@st.cache_data(max_entries=2)
+def load_data(generation):
     """Loads destination data including image_url."""
-    all_data = db_utils.get_all_destinations()
-    if all_data:
+    return to_display_df(db_utils.get_all_destinations())
+
+@st.cache_data(max_entries=2)
+def load_facets(generation):
+    """Region options and cost range for the sidebar filters."""
+    return db_utils.get_destination_facets()
+
+def to_display_df(rows):
+    """Destination rows from db_utils as a DataFrame with display column names."""
+    if rows:
         # ADDED 'image_url' to columns list
         columns = ["id", "name", "region", "highlights", "cost", "image_url"]
-        df = pd.DataFrame(all_data, columns=columns)
+        df = pd.DataFrame(rows, columns=columns)
         df = df.rename(columns={
             "id": "ID", "name": "Destination Name", "region": "Location/Region",
             "highlights": "Highlights", "cost": "Average Cost",
             "image_url": "Image URL" # Added image URL
         })
-        df['DistanceLookupName'] = df['Destination Name'].apply(lambda x: 'Konkan' if x == 'Konkan' else ('Chhatrapati Sambhaji Nagar' if x == 'Chhatrapati Sambhaji Nagar' else x))
         return df
     return pd.DataFrame()
 
-def generate_qr_code(data):
-    """Generates a QR code image."""
-    qr = qrcode.QRCode( version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=4, border=3)
-    qr.add_data(data); qr.make(fit=True); img = qr.make_image(fill_color="black", back_color="white")
-    buf = BytesIO(); img.save(buf, format="PNG"); buf.seek(0)
-    return buf
+@st.cache_resource
+def load_cookie_config():
+    """Auth cookie settings from config.yaml."""
+    with open(db_utils.CONFIG_FILE) as file: return yaml.load(file, Loader=SafeLoader)['cookie']
 
 # --- Initialize Session State ---
 if 'trip_details' not in st.session_state: st.session_state.trip_details = None
 if 'show_confirmation' not in st.session_state: st.session_state.show_confirmation = False
 if 'show_payment_simulation' not in st.session_state: st.session_state.show_payment_simulation = False
 if 'viewing_bookings' not in st.session_state: st.session_state.viewing_bookings = False
+if 'bookings_pages' not in st.session_state: st.session_state.bookings_pages = []
+if 'bookings_pages_user' not in st.session_state: st.session_state.bookings_pages_user = None
+if 'grid_page' not in st.session_state: st.session_state.grid_page = 0
+if 'grid_filters' not in st.session_state: st.session_state.grid_filters = None
+if 'itinerary' not in st.session_state: st.session_state.itinerary = None
 
 # --- USER AUTHENTICATION ---
-with open('config.yaml') as file: config = yaml.load(file, Loader=SafeLoader)
-authenticator = stauth.Authenticate(config['credentials'], config['cookie']['name'], config['cookie']['key'], config['cookie']['expiry_days'])
+# Credentials come from the users table (cached in db_utils); only the cookie settings are read from config.yaml, once per process
+cookie_config = load_cookie_config()
+credentials = db_utils.get_credentials()
+authenticator = stauth.Authenticate(credentials, cookie_config['name'], cookie_config['key'], cookie_config['expiry_days'], auto_hash=False)
 authenticator.login(location='main')
 name = st.session_state.get("name"); authentication_status = st.session_state.get("authentication_status"); username = st.session_state.get("username")
 
 # --- MAIN APP LOGIC (IF LOGGED IN) ---
 if authentication_status:
+    # Deferred heavy imports (pandas, NumPy via pricing): the login page doesn't need them
+    import pandas as pd
+    import itinerary
+    import pricing
+    from pricing import TRANSPORT_RATES_PER_KM
 
     # --- Sidebar ---
     with st.sidebar:
@@ -78,23 +95,27 @@ if authentication_status:
             st.session_state.viewing_bookings = False; st.session_state.trip_details = None
             st.session_state.show_confirmation = False; st.session_state.show_payment_simulation = False
             st.rerun()
-        if st.button("🧾 My Bookings"): st.session_state.viewing_bookings = True; st.rerun()
+        if st.button("🧾 My Bookings"): st.session_state.viewing_bookings = True; st.session_state.bookings_pages = []; st.rerun()
         st.divider()
 
     # --- Header ---
     st.markdown("# 🗺️ Trip Wala 🏖️"); st.markdown("##### *Explore, plan, manage trips.*"); st.divider()
 
     # --- Load Data ---
-    with st.spinner("Loading data... ⏳"): df = load_data()
+    with st.spinner("Loading data... ⏳"): df = load_data(db_utils.get_generation("catalog"))
 
     # --- VIEW MY BOOKINGS ---
     if st.session_state.viewing_bookings:
-        # (This section is unchanged)
         st.markdown("## 🧾 My Bookings")
-        with st.spinner("Loading your bookings..."): user_bookings = db_utils.get_user_bookings(username)
+        # Pages are fetched by keyset cursor and kept in session state, so "Load more" only queries the next page
+        if st.session_state.bookings_pages_user != username: st.session_state.bookings_pages = []; st.session_state.bookings_pages_user = username
+        if not st.session_state.bookings_pages:
+            with st.spinner("Loading your bookings..."): st.session_state.bookings_pages.append(db_utils.get_user_bookings_page(username, limit=BOOKINGS_PAGE_SIZE))
+        user_bookings = [booking for page in st.session_state.bookings_pages for booking in page["bookings"]]
+        next_cursor = st.session_state.bookings_pages[-1]["next_cursor"]
         if not user_bookings: st.info("ℹ️ You haven't booked any trips yet.")
         else:
-            st.write(f"Found {len(user_bookings)} booking(s):")
+            st.write(f"Showing {len(user_bookings)} booking(s){' (most recent first)' if next_cursor else ''}:")
             for booking in user_bookings:
                 try: dt_obj = datetime.datetime.fromisoformat(booking['booking_timestamp']); formatted_date = dt_obj.strftime("%d %b %Y, %I:%M %p")
                 except: formatted_date = str(booking.get('booking_timestamp', 'N/A'))
@@ -102,6 +123,9 @@ if authentication_status:
                     col_b1, col_b2 = st.columns(2)
                     with col_b1: st.write(f"**From:** {booking.get('start_city','N/A')}"); st.write(f"**Persons:** {booking.get('num_people','N/A')}"); st.write(f"**Duration:** {booking.get('stay_days','N/A')}d")
                     with col_b2: st.write(f"**Transport:** {booking.get('transport_mode','N/A')}"); st.write(f"**Cost:** ₹{booking.get('total_budget', 0):,.2f}")
+            if next_cursor and st.button("⬇️ Load more bookings"):
+                with st.spinner("Loading more bookings..."): st.session_state.bookings_pages.append(db_utils.get_user_bookings_page(username, limit=BOOKINGS_PAGE_SIZE, before=next_cursor))
+                st.rerun()
 
     # --- PLAN NEW TRIP (DEFAULT VIEW) ---
     else:
@@ -109,25 +133,60 @@ if authentication_status:
         st.markdown("## 📅 Plan Your Trip")
         if not df.empty:
             # (Planner Inputs remain the same)
+            distance_matrix = pricing.get_distance_matrix()
+            multi_stop = st.radio("Trip type", ["🎯 Single destination", "🧭 Multi-stop circuit"], horizontal=True, key="planner_mode") == "🧭 Multi-stop circuit"
             col1, col2, col3 = st.columns(3)
-            with col1: start_city = st.selectbox("📍 Start City", options=sorted(DISTANCES_FROM_HUBS.keys()), key="start_city"); num_people = st.number_input("👥 Persons", min_value=1, value=1, step=1, key="num_people")
-            with col2: destination_list = sorted(df["Destination Name"].unique().tolist()); destination_name = st.selectbox("🎯 Destination", options=destination_list, key="destination_name"); stay_days = st.number_input("⏳ Stay Days", min_value=1, value=2, step=1, key="stay_days")
+            with col1: start_city = st.selectbox("📍 Start City", options=sorted(distance_matrix.hub_names), key="start_city"); num_people = st.number_input("👥 Persons", min_value=1, value=1, step=1, key="num_people")
+            with col2:
+                destination_list = sorted(df["Destination Name"].unique().tolist())
+                if multi_stop: circuit_stops = st.multiselect("🎯 Stops", options=destination_list, max_selections=itinerary.MAX_STOPS, key="circuit_stops"); stay_days = st.number_input("⏳ Days per Stop", min_value=1, value=2, step=1, key="stay_days")
+                else: destination_name = st.selectbox("🎯 Destination", options=destination_list, key="destination_name"); stay_days = st.number_input("⏳ Stay Days", min_value=1, value=2, step=1, key="stay_days")
             with col3: transport_mode = st.selectbox("🚌/🚗 Transport", options=sorted(TRANSPORT_RATES_PER_KM.keys()), key="transport_mode")
 
+            # --- Multi-Stop Circuit ---
+            # itinerary.plan_itinerary orders the stops (exact for small circuits, time-boxed heuristic above that)
+            if multi_stop:
+                stop_days = {}
+                if circuit_stops:
+                    with st.expander("⏳ Days at each stop"):
+                        day_cols = st.columns(min(4, len(circuit_stops)))
+                        for i, stop in enumerate(circuit_stops):
+                            with day_cols[i % len(day_cols)]: stop_days[stop] = st.number_input(stop, min_value=1, value=stay_days, step=1, key=f"stop_days_{stop}")
+                if st.button("🧭 Plan Cheapest Circuit", disabled=not circuit_stops):
+                    stop_ids = df.drop_duplicates(subset=["Destination Name"]).set_index("Destination Name")["ID"].to_dict()
+                    try: st.session_state.itinerary = itinerary.plan_itinerary(start_city, [int(stop_ids[stop]) for stop in circuit_stops], days=[stop_days[stop] for stop in circuit_stops], num_people=num_people, transport_mode=transport_mode)
+                    except ValueError as e: st.error(f"❌ {e}"); st.session_state.itinerary = None
+                plan = st.session_state.itinerary
+                if plan:
+                    st.subheader(f"🧭 {plan['start_city']} → {' → '.join(stop['name'] for stop in plan['stops'])} → {plan['start_city']}")
+                    saved_km = plan["input_order_km"] - plan["total_distance_km"]
+                    m1, m2, m3 = st.columns(3)
+                    m1.metric("💸 Total Estimated Budget", f"₹{plan['total_budget']:,.2f}"); m2.metric("🛣️ Distance", f"{plan['total_distance_km']:,.0f} km", delta=f"-{saved_km:,.0f} km vs. your order" if saved_km > 0 else None, delta_color="inverse"); m3.metric("⏳ Duration", f"{plan['total_days']}d, {plan['num_people']}p")
+                    st.dataframe([{"Stop": stop["name"], "Leg (km)": stop["leg_km"], "Days": stop["days"], "Base Cost (₹/day)": stop["base_per_person_per_day_cost"], "Stay (₹)": stop["stay_cost"]} for stop in plan["stops"]] + [{"Stop": f"Back to {plan['start_city']}", "Leg (km)": plan["return_km"]}], hide_index=True, width="stretch")
+                    per_person = "" if plan["transport_mode"] in pricing.PER_VEHICLE_MODES else f" x {plan['num_people']}p"
+                    st.markdown(f"**🏨 Base Cost:** **₹{plan['total_base_cost']:,.2f}**"); st.markdown(f"**{'🚗' if plan['transport_mode'] == 'Car' else '🚌'} Transport ({plan['transport_mode']}):** {plan['total_distance_km']:,.0f} km @ ₹{plan['transport_rate']:.2f}/km{per_person} = **₹{plan['total_transport_cost']:,.2f}**")
+                    st.caption(f"Order {'is the cheapest possible' if plan['optimal'] else 'found by heuristic search'} ({plan['solve_ms']:.1f} ms). Legs between stops are estimated from coordinates.")
+
             # --- Budget Calculation Button ---
-            # (Logic is unchanged)
-            if st.button("💰 Calculate Estimated Budget"):
+            elif st.button("💰 Calculate Estimated Budget"):
                 st.session_state.show_confirmation = False; st.session_state.show_payment_simulation = False; st.session_state.trip_details = None
                 try:
-                    dest_row = df.loc[df["Destination Name"] == destination_name].iloc[0]; base_per_person_per_day_cost = dest_row["Average Cost"]; distance_lookup_key = dest_row['DistanceLookupName']
-                    distance_km = DISTANCES_FROM_HUBS[start_city].get(distance_lookup_key)
+                    dest_row = df.loc[df["Destination Name"] == destination_name].iloc[0]; base_per_person_per_day_cost = dest_row["Average Cost"]
+                    distance_km = distance_matrix.distance(start_city, int(dest_row["ID"]))
                     if distance_km is None: st.error(f"❌ Distance data unavailable."); st.session_state.trip_details = None
-                    else:
-                        total_base_cost = base_per_person_per_day_cost * num_people * stay_days; rate = TRANSPORT_RATES_PER_KM[transport_mode]; round_trip_distance = distance_km * 2
-                        total_transport_cost = (round_trip_distance * rate) if transport_mode == "Car" else (round_trip_distance * rate * num_people); total_budget = total_base_cost + total_transport_cost
-                        st.session_state.trip_details = { "start_city": start_city, "destination_name": destination_name, "num_people": num_people, "stay_days": stay_days, "transport_mode": transport_mode, "distance_km": distance_km, "round_trip_distance": round_trip_distance, "base_per_person_per_day_cost": base_per_person_per_day_cost, "total_base_cost": total_base_cost, "transport_rate": rate, "total_transport_cost": total_transport_cost, "total_budget": total_budget }
+                    else: st.session_state.trip_details = pricing.quote_trip(start_city, destination_name, base_per_person_per_day_cost, distance_km, num_people, stay_days, transport_mode)
                 except Exception as e: st.error(f"❌ Calc error."); st.session_state.trip_details = None; print(f"Calc Error: {e}")
 
+            # --- Best Picks From Hub ---
+            with st.expander(f"🏷️ Best picks from {start_city}"):
+                pick_col1, pick_col2, pick_col3 = st.columns(3)
+                with pick_col1: pick_budget = st.number_input("Max total budget (₹, 0 = any)", min_value=0, value=0, step=500, key="pick_budget")
+                with pick_col2: pick_by = st.radio("Sort by", options=["Cheapest", "Nearest"], horizontal=True, key="pick_by")
+                with pick_col3: pick_k = st.number_input("Show top", min_value=1, max_value=20, value=5, step=1, key="pick_k")
+                picks = pricing.rank_destinations(start_city, k=pick_k, budget=pick_budget or None, by="total" if pick_by == "Cheapest" else "distance", num_people=num_people, stay_days=stay_days, transport_mode=transport_mode)
+                if not picks: st.info("ℹ️ No destinations within this budget.")
+                else: st.dataframe([{"Destination": p["name"], "Distance (km)": p["distance_km"], "Base Cost (₹/day)": p["base_cost"], "Total (₹)": round(p["total_budget"], 2)} for p in picks], hide_index=True, width="stretch")
+
             # --- Display Budget, Confirm Button ---
             if st.session_state.trip_details and not st.session_state.show_confirmation and not st.session_state.show_payment_simulation:
                 # (Logic is unchanged)
@@ -160,8 +219,7 @@ if authentication_status:
                 # (Logic is unchanged, includes balloons + delay)
                 trip = st.session_state.trip_details
                 st.divider(); st.markdown("## 💳 Payment Simulation"); st.info("Scan QR code using UPI app (Simulation).")
-                qr_data = f"upi://pay?pa=dummy-payee@okbank&pn=TripWala&am={trip['total_budget']:.2f}&cu=INR&tn=Trip to {trip['destination_name']}"
-                qr_image = generate_qr_code(qr_data)
+                qr_image, _ = payments.payment_qr(trip['total_budget'], trip['destination_name'])  # Memoized: reruns don't re-render
                 col_qr, col_logos = st.columns([1, 2])
                 with col_qr: st.image(qr_image, caption="Scan to Pay (Simulated)", width=150)
                 with col_logos:
@@ -172,6 +230,7 @@ if authentication_status:
                 if st.button("✅ Payment Complete (Simulation)"):
                     booking_saved = db_utils.save_booking(username, trip)
                     if booking_saved: st.success(f"🎉 Payment Received & Trip Booked! (Simulation).")
+                    elif booking_saved is db_utils.BOOKING_PENDING: st.warning("⏳ Payment simulation complete; the booking is still being saved. Check My Bookings before booking again.")
                     else: st.error("⚠️ Payment simulation complete, but failed to save booking.")
                     st.balloons()
                     time.sleep(3) # Delay for balloons
@@ -179,12 +238,13 @@ if authentication_status:
                     st.rerun()
 
         # --- Sidebar Filters ---
-        # (Logic is unchanged)
+        # Options come from indexed facet queries; the filtering itself runs in SQLite (see Filter Logic)
         st.sidebar.markdown("## 🔍 Search & Filter")
-        search_text = st.sidebar.text_input("Search by Destination Name")
-        if not df.empty:
-            region_filter = st.sidebar.selectbox("Filter by Region", options=["All"] + sorted(df['Location/Region'].unique()))
-            min_cost_val = int(df["Average Cost"].min()) if not df.empty and not df["Average Cost"].isnull().all() else 0; max_cost_val = int(df["Average Cost"].max()) if not df.empty and not df["Average Cost"].isnull().all() else 1000
+        search_text = st.sidebar.text_input("Search destinations", placeholder="Name, region or highlight")
+        facets = load_facets(db_utils.get_generation("catalog"))
+        if facets["regions"]:
+            region_filter = st.sidebar.selectbox("Filter by Region", options=["All"] + facets["regions"])
+            min_cost_val = int(facets["min_cost"]) if facets["min_cost"] is not None else 0; max_cost_val = int(facets["max_cost"]) if facets["max_cost"] is not None else 1000
             step_val = 50; min_slider_val = (min_cost_val // step_val) * step_val; max_slider_val = ((max_cost_val // step_val) + 1) * step_val
             if max_slider_val <= min_slider_val: max_slider_val = min_slider_val + step_val
             options_range = range(min_slider_val, max_slider_val + step_val, step_val);
@@ -200,15 +260,19 @@ if authentication_status:
             if st.sidebar.button("➕ Add New"): st.session_state.action = "add"
             if st.sidebar.button("✏️ Update"): st.session_state.action = "update"
             if st.sidebar.button("🗑️ Delete"): st.session_state.action = "delete"
+            if st.sidebar.button("📊 Analytics"): st.session_state.action = "analytics"
+            if st.sidebar.button("📥 Bulk Import"): st.session_state.action = "import"
+            if st.sidebar.button("📤 Export"): st.session_state.action = "export"
         else: st.session_state.action = None
 
         # --- Filter Logic ---
-        # (Logic is unchanged)
-        filtered_df = df.copy();
-        if not filtered_df.empty:
-            if search_text: filtered_df = filtered_df[filtered_df["Destination Name"].str.contains(search_text, case=False)]
-            if region_filter != "All": filtered_df = filtered_df[filtered_df["Location/Region"] == region_filter]
-            filtered_df = filtered_df[(filtered_df["Average Cost"] >= min_budget) & (filtered_df["Average Cost"] <= max_budget)]
+        # Server-side: FTS5 prefix search + indexed region/cost filters, best matches first, one card per name.
+        # Only the visible page is fetched; changing a filter goes back to the first page.
+        grid_filters = (search_text, region_filter, min_budget, max_budget)
+        if st.session_state.grid_filters != grid_filters: st.session_state.grid_filters = grid_filters; st.session_state.grid_page = 0
+        def fetch_grid_page(): return db_utils.search_destinations_page(q=search_text, region=region_filter, min_cost=min_budget, max_cost=max_budget, limit=GRID_PAGE_SIZE, offset=st.session_state.grid_page * GRID_PAGE_SIZE)
+        grid_page = fetch_grid_page(); grid_page_count = max(1, -(-grid_page["total"] // GRID_PAGE_SIZE))
+        if st.session_state.grid_page >= grid_page_count: st.session_state.grid_page = grid_page_count - 1; grid_page = fetch_grid_page()  # Catalog shrank under us
 
         # --- ADMIN ACTION UI ---
         if username == 'admin':
@@ -223,22 +287,26 @@ if authentication_status:
                         new_cost = st.number_input("Cost* (₹ p.p./day)", min_value=0, step=50)
                         # ADDED Image URL input
                         new_image_url = st.text_input("Image URL (Optional)", placeholder="https://.../image.jpg")
+                        new_image_file = st.file_uploader("...or upload an image", type=["jpg", "jpeg", "png", "webp"])
+                        new_lat = st.number_input("Latitude (Optional)", value=None, format="%.4f"); new_lon = st.number_input("Longitude (Optional)", value=None, format="%.4f")
                     with c2:
                         new_highlights = st.text_area("Highlights*", height=150)
                     submitted = st.form_submit_button("✅ Add Destination");
                     if submitted:
                         if not all([new_name, new_region, new_highlights]) or new_cost < 0: st.error("❌ Fill required fields *.")
                         else:
+                            if new_image_file: new_image_url = images.save_upload(new_image_file.getvalue(), new_image_file.name)
                             # Pass 5 arguments
-                            if db_utils.add_destination(new_name, new_region, new_highlights, new_cost, new_image_url):
-                                st.toast(f"✅ Added {new_name}!", icon="🎉"); st.session_state.action = None; st.cache_data.clear(); st.rerun()
+                            if db_utils.add_destination(new_name, new_region, new_highlights, new_cost, new_image_url, new_lat, new_lon):
+                                pricing.compute_missing_distances()  # Hub distances for the new destination, if it has coordinates
+                                st.toast(f"✅ Added {new_name}!", icon="🎉"); st.session_state.action = None; st.rerun()
                             else: st.error("❌ Failed to add.")
             elif st.session_state.action == "update":
                 st.markdown("### ✏️ Update Destination")
                 if not df.empty:
                     all_dest_dict = df.drop_duplicates(subset=["Destination Name"]).set_index("Destination Name")["ID"].to_dict(); select_options = ["--Select--"] + sorted(all_dest_dict.keys()); selected_name = st.selectbox("Select destination", options=select_options)
                     if selected_name != "--Select--":
-                        all_dest_details = db_utils.get_all_destinations(); dest_details_df = pd.DataFrame(all_dest_details); dest_row = dest_details_df[dest_details_df["name"] == selected_name].iloc[0]; st.session_state.edit_id = int(dest_row["id"])
+                        dest_row = db_utils.get_destination(int(all_dest_dict[selected_name])); st.session_state.edit_id = dest_row["id"]
                         with st.form("update_form"):
                              c1, c2 = st.columns(2)
                              with c1:
@@ -246,20 +314,24 @@ if authentication_status:
                                  up_region = st.text_input("Region*", dest_row["region"])
                                  up_cost = st.number_input("Cost* (₹ p.p./day)", min_value=0, step=50, value=int(dest_row["cost"]))
                                  # ADDED Image URL input
-                                 up_image_url = st.text_input("Image URL", value=dest_row.get("image_url", ""))
+                                 up_image_url = st.text_input("Image URL", value=dest_row["image_url"] or "")
+                                 up_image_file = st.file_uploader("...or upload a new image", type=["jpg", "jpeg", "png", "webp"])
+                                 up_lat = st.number_input("Latitude", value=dest_row["latitude"], format="%.4f"); up_lon = st.number_input("Longitude", value=dest_row["longitude"], format="%.4f")
                              with c2:
                                  up_highlights = st.text_area("Highlights*", dest_row["highlights"], height=150)
                              submitted = st.form_submit_button("💾 Update");
                              if submitted:
                                  if not all([up_name, up_region, up_highlights]) or up_cost < 0: st.error("❌ Fill required fields *.")
                                  else:
+                                     if up_image_file: up_image_url = images.save_upload(up_image_file.getvalue(), up_image_file.name)
                                      # Pass 6 arguments
-                                     if db_utils.update_destination(st.session_state.edit_id, up_name, up_region, up_highlights, up_cost, up_image_url):
-                                         st.toast(f"✅ Updated {up_name}!", icon="👍"); st.session_state.action = None; st.session_state.edit_id = None; st.cache_data.clear(); st.rerun()
+                                     if db_utils.update_destination(st.session_state.edit_id, up_name, up_region, up_highlights, up_cost, up_image_url, up_lat, up_lon):
+                                         pricing.compute_missing_distances()
+                                         if up_image_url != dest_row["image_url"]: images.invalidate(st.session_state.edit_id)  # Old thumbnail is stale
+                                         st.toast(f"✅ Updated {up_name}!", icon="👍"); st.session_state.action = None; st.session_state.edit_id = None; st.rerun()
                                      else: st.error("❌ Failed to update.")
                 else: st.warning("⚠️ No destinations to update.")
             elif st.session_state.action == "delete":
-                 # (Logic is unchanged)
                  st.markdown("### 🗑️ Delete Destination")
                  if not df.empty:
                     all_dest_dict = df.drop_duplicates(subset=["Destination Name"]).set_index("Destination Name")["ID"].to_dict(); select_options = ["--Select--"] + sorted(all_dest_dict.keys()); selected_name = st.selectbox("Select destination", options=select_options)
@@ -268,38 +340,139 @@ if authentication_status:
                         col_del1, col_del2 = st.columns([1, 4]);
                         with col_del1:
                             if st.button("Yes, Delete", type="primary"):
-                                if db_utils.delete_destination(delete_id): st.toast(f"🗑️ Deleted {selected_name}.", icon="✅"); st.session_state.action = None; st.cache_data.clear(); st.rerun()
+                                if db_utils.delete_destination(delete_id): images.invalidate(delete_id); st.toast(f"🗑️ Deleted {selected_name}.", icon="✅"); st.session_state.action = None; st.rerun()
                                 else: st.error("❌ Failed to delete.")
                         with col_del2:
                              if st.button("Cancel"): st.session_state.action = None; st.rerun()
                  else: st.warning("⚠️ No destinations to delete.")
+            elif st.session_state.action == "analytics":
+                # Reads only the rollup tables, so this stays fast however many bookings exist
+                st.markdown("### 📊 Booking Analytics")
+                today = datetime.datetime.now(datetime.timezone.utc).date()
+                date_range = st.date_input("Date range (UTC)", value=(today - datetime.timedelta(days=29), today))
+                start_day, end_day = (date_range[0], date_range[-1]) if date_range else (None, None)
+                daily = pd.DataFrame(db_utils.get_daily_totals(start_day, end_day), columns=["day", "bookings", "travellers", "revenue"])
+                m1, m2, m3 = st.columns(3)
+                m1.metric("Bookings", f"{int(daily['bookings'].sum()):,}"); m2.metric("Travellers", f"{int(daily['travellers'].sum()):,}"); m3.metric("Revenue", f"₹{daily['revenue'].sum():,.0f}")
+                if daily.empty: st.info("ℹ️ No bookings in this range.")
+                else: st.line_chart(daily.set_index("day")[["revenue"]])
+                for col, dimension, label in zip(st.columns(3), ("destination", "start_city", "transport_mode"), ("Top Destinations", "Top Start Cities", "Transport Modes")):
+                    with col:
+                        st.markdown(f"**{label}**")
+                        st.dataframe(pd.DataFrame(db_utils.get_top_by(dimension, start_day, end_day)), hide_index=True, width="stretch")
+                st.markdown("**Most Booked Routes (all time)**")
+                st.dataframe(pd.DataFrame(db_utils.get_top_routes()), hide_index=True, width="stretch")
+                col_a1, col_a2 = st.columns([1, 4])
+                with col_a1:
+                    if st.button("🔁 Rebuild rollups"): st.toast(f"Rebuilt from {db_utils.rebuild_rollups():,} bookings.", icon="✅")
+                with col_a2:
+                    if st.button("Close"): st.session_state.action = None; st.rerun()
+            elif st.session_state.action == "export":
+                # Rows are streamed in chunks from the DB; the download button needs the finished file, so it is built here first.
+                # For very large exports use the API instead (GET /export/bookings.parquet), which streams straight to the client.
+                import exports
+                from io import BytesIO
+                st.markdown("### 📤 Export Data")
+                c1, c2 = st.columns(2)
+                with c1: export_dataset = st.radio("Dataset", ["bookings", "destinations"], horizontal=True)
+                with c2: export_format = st.radio("Format", list(exports.FORMATS), horizontal=True)
+                export_filters = {}
+                if export_dataset == "bookings":
+                    c3, c4 = st.columns(2)
+                    with c3: export_user = st.text_input("Username (Optional)")
+                    with c4: export_range = st.date_input("Booked between (UTC, Optional)", value=())
+                    export_filters = {"username": export_user or None, "start": export_range[0] if export_range else None, "end": export_range[-1] if export_range else None}
+                col_e1, col_e2 = st.columns([1, 4])
+                with col_e1:
+                    if st.button("⚙️ Prepare export"):
+                        buf = BytesIO(); written = exports.write_export(buf, export_dataset, export_format, **export_filters)
+                        st.session_state.export_file = (f"{export_dataset}.{export_format}", buf.getvalue(), exports.FORMATS[export_format]); st.toast(f"Export ready ({written / 1024:,.0f} KB).", icon="✅")
+                with col_e2:
+                    if st.button("Close", key="close_export"): st.session_state.action = None; st.session_state.export_file = None; st.rerun()
+                if st.session_state.get("export_file"):
+                    file_name, data, mime = st.session_state.export_file
+                    st.download_button(f"⬇️ Download {file_name}", data, file_name=file_name, mime=mime)
+            elif st.session_state.action == "import":
+                # One transaction and one catalog generation bump for the whole file, however many rows it has
+                st.markdown("### 📥 Bulk Import Destinations")
+                st.caption(f"CSV with a header row, or a JSON list of objects. Fields: {', '.join(db_utils.IMPORT_FIELDS)} (image_url, latitude and longitude optional). Existing names are updated, new names added.")
+                import_file = st.file_uploader("Destinations file", type=["csv", "json"], key="import_file")
+                all_or_nothing = st.checkbox("Import nothing if any row is invalid", key="import_all_or_nothing")
+                col_i1, col_i2 = st.columns([1, 4])
+                with col_i1:
+                    if st.button("📥 Import", disabled=import_file is None):
+                        try:
+                            rows = db_utils.parse_import_file(import_file.getvalue(), import_file.name)
+                            with st.spinner(f"Importing {len(rows):,} rows..."): report = db_utils.import_destinations(rows, all_or_nothing=all_or_nothing)
+                            if report is None: st.error("❌ Import failed.")
+                            else:
+                                images.invalidate_many(report["images_changed"])
+                                if report["ids"]: pricing.compute_missing_distances()
+                                st.session_state.import_report = dict(report, all_or_nothing=all_or_nothing)
+                        except ValueError as e: st.error(f"❌ {e}")
+                with col_i2:
+                    if st.button("Close", key="close_import"): st.session_state.action = None; st.session_state.import_report = None; st.rerun()
+                report = st.session_state.get("import_report")
+                if report:
+                    m1, m2, m3, m4 = st.columns(4)
+                    m1.metric("Added", f"{report['inserted']:,}"); m2.metric("Updated", f"{report['updated']:,}"); m3.metric("Unchanged", f"{report['unchanged']:,}"); m4.metric("Errors", f"{len(report['errors']):,}")
+                    if report["errors"]:
+                        if report["all_or_nothing"]: st.warning("⚠️ Nothing was imported because some rows are invalid.")
+                        st.dataframe([{"Row": e["index"] + 1, "Name": e["name"], "Error": e["error"]} for e in report["errors"]], hide_index=True, width="stretch")
 
         # --- Available Destinations Display ---
         st.divider(); st.markdown("### 📌 Available Destinations"); st.write("_Matching filters._"); st.caption("Cost ₹ p.p./day.")
-        if filtered_df.empty: st.info("ℹ️ No matches.")
+        grid_rows = grid_page["destinations"]
+        if not grid_rows: st.info("ℹ️ No matches.")
         else:
-            displayed_names = set(); cols = st.columns(3); col_index = 0
-            for index, row in filtered_df.iterrows():
-                if row['Destination Name'] not in displayed_names:
-                    with cols[col_index % 3]:
-                        with st.container(border=True):
-                            
-                            # --- ROBUST IMAGE DISPLAY ---
-                            image_url = row.get("Image URL")
-                            if image_url and isinstance(image_url, str) and image_url.startswith("http"):
-                                st.image(image_url, caption=f"{row['Destination Name']}")
-                            else:
-                                st.image(PLACEHOLDER_IMAGE_URL, caption="Image not available")
-                            # --- END IMAGE DISPLAY ---
+            # Local, cached thumbnails (fetched concurrently on first view) instead of full-size remote images
+            thumbnails = images.get_thumbnails(grid_rows)
+            cols = st.columns(3)
+            for col_index, dest in enumerate(grid_rows):
+                with cols[col_index % 3]:
+                    with st.container(border=True):
+
+                        # --- ROBUST IMAGE DISPLAY ---
+                        thumbnail = thumbnails.get(dest["id"])
+                        if thumbnail:
+                            st.image(thumbnail, caption=f"{dest['name']}")
+                        else:
+                            st.image(images.placeholder_thumbnail()[0], caption="Image not available")
+                        # --- END IMAGE DISPLAY ---
+
+                        st.subheader(f"{dest['name']}"); st.caption(f"{dest['region']}")
+                        st.write(f"**Highlights:** {dest['highlights']}")
+                        st.metric(label="Base Cost", value=f"₹{dest['cost']}")
+
+            # --- Page Controls ---
+            first_shown = grid_page["offset"] + 1; last_shown = grid_page["offset"] + len(grid_rows)
+            col_prev, col_info, col_next = st.columns([1, 3, 1])
+            with col_prev:
+                if st.button("◀ Previous", disabled=st.session_state.grid_page == 0): st.session_state.grid_page -= 1; st.rerun()
+            with col_info: st.caption(f"Showing {first_shown}–{last_shown} of {grid_page['total']} · page {st.session_state.grid_page + 1} of {grid_page_count}")
+            with col_next:
+                if st.button("Next ▶", disabled=st.session_state.grid_page + 1 >= grid_page_count): st.session_state.grid_page += 1; st.rerun()
 
-                            st.subheader(f"{row['Destination Name']}"); st.caption(f"{row['Location/Region']}")
-                            st.write(f"**Highlights:** {row['Highlights']}")
-                            st.metric(label="Base Cost", value=f"₹{row['Average Cost']}")
-                    displayed_names.add(row['Destination Name']); col_index += 1
+        # --- Admin Timing Panel ---
+        if username == 'admin' and st.sidebar.checkbox("⏱️ Show rerun timings", key="show_rerun_timings"):
+            events = metrics.stop_capture(); rerun_ms = (time.perf_counter() - rerun_started) * 1000
+            with st.expander(f"⏱️ This rerun took {rerun_ms:.0f} ms", expanded=True):
+                if not metrics.ENABLED: st.info("ℹ️ Metrics are disabled (TRIPWALA_METRICS=0).")
+                else:
+                    timings = {}
+                    for metric, labels, seconds in events:
+                        key = ("SQL", labels["statement"]) if metric == "tripwala_sql_seconds" else ("Function", labels.get("function", metric))
+                        calls, total, slowest = timings.get(key, (0, 0.0, 0.0)); timings[key] = (calls + 1, total + seconds, max(slowest, seconds))
+                    rows = [{"Kind": kind, "Name": name, "Calls": calls, "Total (ms)": round(total * 1000, 2), "Max (ms)": round(slowest * 1000, 2)} for (kind, name), (calls, total, slowest) in timings.items()]
+                    if rows: st.dataframe(pd.DataFrame(rows).sort_values("Total (ms)", ascending=False), hide_index=True, width="stretch")
+                    else: st.caption("No instrumented calls in this rerun.")
+                    slow = metrics.get_slow_queries()[:10]
+                    if slow:
+                        st.markdown(f"**Recent slow queries (≥ {metrics.SLOW_QUERY_SECONDS * 1000:.0f} ms)**")
+                        st.dataframe(pd.DataFrame(slow)[["duration_ms", "sql", "params"]], hide_index=True, width="stretch")
 
 
 # --- LOGIN FAILURES / REGISTRATION ---
-# (Logic is unchanged)
 elif authentication_status is False: st.error('⚠️ Username/password incorrect')
 elif authentication_status is None:
     st.warning('🔒 Please enter username and password')
@@ -307,8 +480,7 @@ elif authentication_status is None:
         with st.expander("👤 New user? Register here!"):
             email, username_reg, name_reg = authenticator.register_user(location='main', fields={'Form name': 'Register New User'}, pre_authorized=None)
             if email:
-                st.success('✅ User registered! Please log in.');
-                try: 
-                    with open('config.yaml', 'w') as file: yaml.dump(config, file, default_flow_style=False)
-                except Exception as yaml_err: st.error(f"Failed to update config: {yaml_err}")
+                # The authenticator added the (hashed) entry to the credential map; persist just that one row
+                if db_utils.add_user(username_reg, credentials['usernames'][username_reg.lower()]): st.success('✅ User registered! Please log in.')
+                else: st.error("⚠️ Registration failed: username or email already taken.")
     except Exception as e: st.error(f"Reg error: {e}")
\ No newline at end of file
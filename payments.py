@@ -0,0 +1,52 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+# --- Settings ---
+UPI_PAYEE = "dummy-payee@okbank"
+UPI_PAYEE_NAME = "TripWala"
+QR_CACHE_SIZE = 512   # Rendered QR codes kept in memory (a PNG is ~1 KB)
+QR_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+# --- UPI Payload ---
+def upi_payload(amount, destination_name, payee=UPI_PAYEE):
+    """The simulated UPI deep link encoded in the payment QR code."""
+    return f"upi://pay?pa={payee}&pn={UPI_PAYEE_NAME}&am={float(amount):.2f}&cu=INR&tn=Trip to {destination_name}"
+
+# --- QR Rendering ---
+@functools.lru_cache(maxsize=QR_CACHE_SIZE)
+def _render_qr(payload, fmt):
+    import qrcode
+    qr = qrcode.QRCode( version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=4, border=3)
+    qr.add_data(payload); qr.make(fit=True)
+    buf = BytesIO()
+    if fmt == "svg":
+        # Vector output skips raster drawing and PNG encoding entirely
+        from qrcode.image.svg import SvgPathImage
+        qr.make_image(image_factory=SvgPathImage).save(buf)
+    else: qr.make_image(fill_color="black", back_color="white").save(buf, format="PNG")
+    return buf.getvalue()
+
+def render_qr(payload, fmt="png"):
+    """QR code bytes for a payload, memoized so reruns with an unchanged payload cost a dict lookup."""
+    if fmt not in QR_FORMATS: raise ValueError(f"format must be one of {', '.join(QR_FORMATS)}")
+    return _render_qr(payload, fmt)
+
+def payment_qr(amount, destination_name, fmt="png", payee=UPI_PAYEE):
+    """Returns (bytes, media_type) of the payment QR code for a trip."""
+    return render_qr(upi_payload(amount, destination_name, payee), fmt), QR_FORMATS[fmt]
+
+def generate_qr_code(data):
+    """Generates a QR code image."""
+    return BytesIO(render_qr(data))
+
+def prerender_qr_codes(bookings, fmt="png", max_workers=4):
+    """Warms the cache for many pending bookings (dicts with total_budget and destination_name). Returns the payloads rendered."""
+    payloads = list(dict.fromkeys(upi_payload(b["total_budget"], b["destination_name"]) for b in bookings))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda payload: render_qr(payload, fmt), payloads))
+    return payloads
+
+def get_cache_stats():
+    info = _render_qr.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "max_size": info.maxsize}
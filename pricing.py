@@ -0,0 +1,153 @@
+import numpy as np
+import db_utils
+
+# --- Pricing Constants ---
+TRANSPORT_RATES_PER_KM = { "Bus": 2.5, "Car": 14.0 }
+PER_VEHICLE_MODES = {"Car"}  # Car fare is per vehicle; every other mode is charged per person
+ROAD_FACTOR = 1.2  # Road km per great-circle km, used when a distance has to be estimated from coordinates
+EARTH_RADIUS_KM = 6371.0
+MAX_QUOTE_CELLS = 2_000_000  # Upper bound on destinations x hubs x modes x party sizes x stay lengths per request
+
+# --- Single Trip Quote ---
+def quote_trip(start_city, destination_name, base_per_person_per_day_cost, distance_km, num_people, stay_days, transport_mode):
+    """Prices one round trip. Returns the trip_details dict used by the planner and booking flow."""
+    total_base_cost = base_per_person_per_day_cost * num_people * stay_days; rate = TRANSPORT_RATES_PER_KM[transport_mode]; round_trip_distance = distance_km * 2
+    total_transport_cost = (round_trip_distance * rate) if transport_mode in PER_VEHICLE_MODES else (round_trip_distance * rate * num_people); total_budget = total_base_cost + total_transport_cost
+    return { "start_city": start_city, "destination_name": destination_name, "num_people": num_people, "stay_days": stay_days, "transport_mode": transport_mode, "distance_km": distance_km, "round_trip_distance": round_trip_distance, "base_per_person_per_day_cost": base_per_person_per_day_cost, "total_base_cost": total_base_cost, "transport_rate": rate, "total_transport_cost": total_transport_cost, "total_budget": total_budget }
+
+# --- Distance Matrix ---
+class DistanceMatrix:
+    """
+    Dense (hub x destination) array of one-way km loaded from the distances table.
+    Rows and columns follow ascending hub/destination ids; ids map to positions with
+    np.searchsorted. Unknown distances are NaN.
+    """
+
+    def __init__(self, data):
+        hubs = data["hubs"]; destinations = data["destinations"]
+        self.hub_ids = np.array([h[0] for h in hubs], dtype=np.int64); self.hub_names = [h[1] for h in hubs]
+        self.hub_coords = np.array([[h[2], h[3]] for h in hubs], dtype=float).reshape(len(hubs), 2)
+        self.destination_ids = np.array([d[0] for d in destinations], dtype=np.int64); self.destination_names = [d[1] for d in destinations]
+        self.costs = np.array([d[2] for d in destinations], dtype=float)  # NULL cost -> NaN
+        self.destination_coords = np.array([[d[3], d[4]] for d in destinations], dtype=float).reshape(len(destinations), 2)
+        self.km = np.full((len(hubs), len(destinations)), np.nan)
+        self._hub_index = {name: i for i, name in enumerate(self.hub_names)}
+        if data["distances"]:
+            hub_id, dest_id, km = (np.array(col) for col in zip(*data["distances"]))
+            rows = self._positions(self.hub_ids, hub_id); cols = self._positions(self.destination_ids, dest_id)
+            keep = (rows >= 0) & (cols >= 0)  # Ignore distances for deleted hubs/destinations
+            self.km[rows[keep], cols[keep]] = km[keep]
+
+    @staticmethod
+    def _positions(sorted_ids, ids):
+        """Positions of ids within sorted_ids; -1 where an id is absent."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(sorted_ids) == 0: return np.full(len(ids), -1)
+        pos = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        return np.where(sorted_ids[pos] == ids, pos, -1)
+
+    def hub_index(self, hub):
+        if hub not in self._hub_index: raise ValueError(f"Unknown hub: {hub}")
+        return self._hub_index[hub]
+
+    def destination_positions(self, destination_ids):
+        return self._positions(self.destination_ids, destination_ids)
+
+    def distance(self, hub, destination_id):
+        """One-way km from a hub to a destination, or None if unknown."""
+        if hub not in self._hub_index: return None
+        col = self.destination_positions([destination_id])[0]
+        km = self.km[self._hub_index[hub], col] if col >= 0 else np.nan
+        return None if np.isnan(km) else float(km)
+
+_matrix = None; _matrix_generation = None
+
+def get_distance_matrix():
+    """Returns the cached distance matrix, reloading it only after hubs, destinations or distances change."""
+    global _matrix, _matrix_generation
+    generation = db_utils.get_generation("distances")
+    if _matrix is None or _matrix_generation != generation:
+        _matrix = DistanceMatrix(db_utils.get_distance_data()); _matrix_generation = generation
+    return _matrix
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; works elementwise on NumPy arrays."""
+    lat1, lon1, lat2, lon2 = (np.radians(x) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def compute_missing_distances(road_factor=ROAD_FACTOR):
+    """Estimates every unknown hub->destination distance where both ends have coordinates. Returns rows saved."""
+    matrix = get_distance_matrix()
+    hub_lat, hub_lon = matrix.hub_coords[:, 0][:, None], matrix.hub_coords[:, 1][:, None]
+    dest_lat, dest_lon = matrix.destination_coords[:, 0][None, :], matrix.destination_coords[:, 1][None, :]
+    estimated = np.round(haversine_km(hub_lat, hub_lon, dest_lat, dest_lon) * road_factor)
+    rows, cols = np.nonzero(np.isnan(matrix.km) & ~np.isnan(estimated))
+    if len(rows) == 0: return 0
+    return db_utils.save_distances(zip(matrix.hub_ids[rows].tolist(), matrix.destination_ids[cols].tolist(), estimated[rows, cols].tolist()))
+
+# --- Vectorized Batch Quotes ---
+def distance_array(destination_ids, hubs):
+    """One-way km as a (destinations, hubs) float array; NaN where no distance is known."""
+    matrix = get_distance_matrix(); cols = matrix.destination_positions(destination_ids)
+    km = np.full((len(cols), len(hubs)), np.nan)
+    for j, hub in enumerate(hubs):
+        row = matrix.km[matrix.hub_index(hub)]
+        km[cols >= 0, j] = row[cols[cols >= 0]]
+    return km
+
+def quote_matrix(base_costs, distances, modes, num_people, stay_days):
+    """
+    Prices every destination x hub x mode x party size x stay length in one pass.
+    base_costs is (D,) and distances is (D, H) one-way km. Returns totals shaped
+    (D, H, len(modes), len(num_people), len(stay_days)); NaN where distance is unknown.
+    Uses the same operation order as quote_trip() so totals match it exactly.
+    """
+    unknown = [mode for mode in modes if mode not in TRANSPORT_RATES_PER_KM]
+    if unknown: raise ValueError(f"Unknown transport mode(s): {', '.join(unknown)}")
+    cost = np.asarray(base_costs, dtype=float)[:, None, None, None, None]
+    round_trip = np.asarray(distances, dtype=float)[:, :, None, None, None] * 2
+    rate = np.array([TRANSPORT_RATES_PER_KM[mode] for mode in modes], dtype=float)[None, None, :, None, None]
+    per_person = np.array([mode not in PER_VEHICLE_MODES for mode in modes])[None, None, :, None, None]
+    people = np.asarray(num_people, dtype=float)[None, None, None, :, None]
+    days = np.asarray(stay_days, dtype=float)[None, None, None, None, :]
+    total_base_cost = cost * people * days
+    transport = round_trip * rate
+    total_transport_cost = np.where(per_person, transport * people, transport)
+    return total_base_cost + total_transport_cost
+
+def get_quote_matrix(hubs=None, modes=None, num_people=(1,), stay_days=(2,)):
+    """Batch-prices the whole destination catalog. Returns a JSON-ready dict with the axis labels and nested totals (None = no distance)."""
+    hubs = list(hubs or sorted(get_distance_matrix().hub_names)); modes = list(modes or sorted(TRANSPORT_RATES_PER_KM))
+    num_people = list(num_people); stay_days = list(stay_days)
+    destinations = db_utils.get_all_destinations()
+    cells = len(destinations) * len(hubs) * len(modes) * len(num_people) * len(stay_days)
+    if cells > MAX_QUOTE_CELLS: raise ValueError(f"Quote matrix too large ({cells:,} cells, max {MAX_QUOTE_CELLS:,}).")
+    names = [d["name"] for d in destinations]
+    totals = quote_matrix([d["cost"] or 0 for d in destinations], distance_array([d["id"] for d in destinations], hubs), modes, num_people, stay_days)
+    totals = np.where(np.isnan(totals), None, totals.astype(object))
+    return {"destinations": names, "destination_ids": [d["id"] for d in destinations], "hubs": hubs, "modes": modes,
+            "num_people": num_people, "stay_days": stay_days, "totals": totals.tolist()}
+
+# --- Ranking Queries ---
+RANK_KEYS = ("total", "distance")
+
+def rank_destinations(hub, k=5, budget=None, by="total", num_people=1, stay_days=2, transport_mode="Car"):
+    """
+    Top-k destinations from a hub, cheapest total ("total") or nearest ("distance") first,
+    optionally only those whose total fits within budget. Uses np.argpartition so only the
+    k winners are fully sorted.
+    """
+    if by not in RANK_KEYS: raise ValueError(f"'by' must be one of {', '.join(RANK_KEYS)}")
+    matrix = get_distance_matrix(); km = matrix.km[matrix.hub_index(hub)]
+    totals = quote_matrix(matrix.costs, km[:, None], [transport_mode], [num_people], [stay_days])[:, 0, 0, 0, 0]
+    eligible = ~np.isnan(totals)
+    if budget is not None: eligible &= totals <= budget
+    candidates = np.flatnonzero(eligible)
+    if k <= 0 or len(candidates) == 0: return []
+    keys = (totals if by == "total" else km)[candidates]
+    if len(candidates) > k: top = np.argpartition(keys, k - 1)[:k]
+    else: top = np.arange(len(candidates))
+    top = top[np.argsort(keys[top], kind="stable")]
+    return [{"id": int(matrix.destination_ids[i]), "name": matrix.destination_names[i], "distance_km": float(km[i]), "base_cost": float(matrix.costs[i]),
+             "total_budget": float(totals[i])} for i in candidates[top]]
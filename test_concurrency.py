@@ -0,0 +1,117 @@
+"""
+Concurrency checks for the connection pool and the group-commit booking writer.
+Run with: python -m unittest test_concurrency (from the repo root).
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import db_utils
+
+TRIP = {"start_city": "Pune", "destination_name": "Goa", "num_people": 2, "stay_days": 3, "transport_mode": "Car", "total_budget": 9000}
+BUSY_TIMEOUT_MS = 200  # Short busy timeout so the lock-contention test stays fast
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline: raise AssertionError("condition not met in time")
+        time.sleep(0.01)
+
+# --- Connection Pool ---
+class ConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(); self.db_file = os.path.join(self.dir, "pool.db")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def test_broken_connection_wakes_waiting_acquire(self):
+        pool = db_utils.ConnectionPool(self.db_file, size=1, timeout=5)
+        conn = pool.acquire(); got = {}
+        def waiter():
+            started = time.perf_counter(); got["conn"] = pool.acquire(); got["waited"] = time.perf_counter() - started
+        thread = threading.Thread(target=waiter); thread.start()
+        wait_until(lambda: pool.stats()["waits"] == 1)
+        conn.close(); pool.release(conn)  # Closed, so release() can't roll it back and drops it
+        thread.join(5)
+        self.assertLess(got["waited"], 1.0)  # Woken by the free slot, not by POOL_TIMEOUT
+        self.assertIsNot(got["conn"], conn); got["conn"].execute("SELECT 1")
+        self.assertEqual(pool.stats()["open"], 1); self.assertEqual(pool.stats()["in_use"], 1)
+        pool.release(got["conn"]); pool.close_all()
+        self.assertEqual(pool.stats()["open"], 0); self.assertEqual(pool.stats()["idle"], 0)
+
+    def test_exhausted_pool_times_out(self):
+        pool = db_utils.ConnectionPool(self.db_file, size=1, timeout=0.1); conn = pool.acquire()
+        with self.assertRaises(sqlite3.OperationalError): pool.acquire()
+        pool.release(conn); pool.close_all()
+
+    def test_failed_connect_frees_its_slot(self):
+        pool = db_utils.ConnectionPool(self.db_file, size=1, timeout=0.5)
+        with mock.patch.object(pool, "_connect", side_effect=sqlite3.OperationalError("unable to open database file")):
+            with self.assertRaises(sqlite3.OperationalError): pool.acquire()
+        conn = pool.acquire()  # The slot came back: no wait, no timeout
+        self.assertEqual(pool.stats()["waits"], 0); self.assertEqual(pool.stats()["open"], 1)
+        pool.release(conn); pool.close_all()
+
+# --- Booking Writer ---
+class BookingWriterTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        cls.patches = [mock.patch.object(db_utils, "DB_FILE", os.path.join(cls.dir, "bookings.db")),
+                       mock.patch.object(db_utils, "BUSY_TIMEOUT_MS", BUSY_TIMEOUT_MS),
+                       mock.patch.dict(db_utils.PRAGMAS, {"busy_timeout": BUSY_TIMEOUT_MS})]
+        for patch in cls.patches: patch.start()
+        db_utils.initialize_database()
+
+    @classmethod
+    def tearDownClass(cls):
+        db_utils.get_pool().close_all()
+        for patch in reversed(cls.patches): patch.stop()
+        shutil.rmtree(cls.dir, ignore_errors=True)
+
+    def count(self, username):
+        conn = sqlite3.connect(db_utils.DB_FILE)
+        try: return conn.execute("SELECT COUNT(*) FROM bookings WHERE username = ?", (username,)).fetchone()[0]
+        finally: conn.close()
+
+    def test_bad_row_fails_alone(self):
+        writer = db_utils.BookingWriter()
+        futures = [writer.submit("row_ok_1", TRIP), writer.submit("row_bad", dict(TRIP, total_budget=[1])), writer.submit("row_ok_2", TRIP)]
+        self.assertTrue(futures[0].result(5)); self.assertTrue(futures[2].result(5))
+        self.assertIsInstance(futures[1].exception(5), sqlite3.Error)
+        self.assertEqual([self.count(u) for u in ("row_ok_1", "row_bad", "row_ok_2")], [1, 0, 1])
+        self.assertEqual(writer.stats()["failed"], 1)
+
+    def test_locked_database_fails_whole_batch_at_once(self):
+        writer = db_utils.BookingWriter(max_latency=0.05)
+        lock = sqlite3.connect(db_utils.DB_FILE); lock.execute("BEGIN IMMEDIATE")
+        try:
+            started = time.perf_counter(); futures = [writer.submit(f"locked_{i}", TRIP) for i in range(6)]
+            errors = [future.exception(5) for future in futures]; elapsed = time.perf_counter() - started
+        finally: lock.rollback(); lock.close()
+        self.assertTrue(all(isinstance(e, sqlite3.OperationalError) for e in errors))
+        self.assertLess(elapsed, 3 * BUSY_TIMEOUT_MS / 1000)  # One busy timeout, not one per booking
+        self.assertEqual(writer.stats()["failed"], 6)
+
+    def test_timed_out_booking_is_withdrawn_or_pending(self):
+        writer = db_utils.BookingWriter(max_latency=0); gate = threading.Event(); commit = writer._commit
+        writer._commit = lambda batch: (gate.wait(5), commit(batch))
+        results = {}
+        with mock.patch.object(db_utils, "_booking_writer", writer), mock.patch.object(db_utils, "BOOKING_SAVE_TIMEOUT", 0.2):
+            first = threading.Thread(target=lambda: results.setdefault("running", db_utils.save_booking("timeout_running", TRIP))); first.start()
+            wait_until(lambda: writer.stats()["queued"] == 0); time.sleep(0.05)  # The writer has taken it and is blocked committing
+            results["queued"] = db_utils.save_booking("timeout_queued", TRIP)
+            first.join(5)
+        gate.set(); wait_until(lambda: writer.stats()["committed"] == 1 and writer.stats()["queued"] == 0)
+        self.assertIs(results["running"], db_utils.BOOKING_PENDING)  # Already committing: may still be saved
+        self.assertIs(results["queued"], False)                      # Withdrawn: safe to retry
+        self.assertEqual(self.count("timeout_running"), 1); self.assertEqual(self.count("timeout_queued"), 0)
+
+if __name__ == "__main__":
+    unittest.main()